@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""Cold start time and per-worker memory of the production entry point.
+
+Seeds a SQLite database at the requested scale, then:
+
+* imports ``server.wsgi`` in a fresh interpreter with and without warmup,
+  timing the import and the first /port_pairs and /rates requests;
+* starts gunicorn with server/gunicorn.conf.py (app preloaded in the master)
+  and without it (every worker imports the app itself), timing how long
+  until the server answers and reading each worker's RSS and PSS from
+  /proc. PSS splits shared pages between the processes sharing them, so its
+  sum is the real memory cost of the worker pool.
+
+    python -m benchmarks.cold_start --ports 5000 --workers 4
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+IMPORT_PROBE = '''
+import json, time
+t0 = time.perf_counter()
+from server.wsgi import app
+t1 = time.perf_counter()
+client = app.test_client()
+client.get("/port_pairs")
+t2 = time.perf_counter()
+client.get("/rates?port_pair_id=1")
+t3 = time.perf_counter()
+print(json.dumps({"import_s": t1 - t0, "first_port_pairs_s": t2 - t1, "first_rates_s": t3 - t2}))
+'''
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def children(pid):
+    kids = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            kids.append(int(entry))
+    return kids
+
+
+def memory_kb(pid):
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            key, _, rest = line.partition(':')
+            if key in ('Rss', 'Pss'):
+                values[key.lower()] = int(rest.split()[0])
+    return values
+
+
+def probe_import(env, warmup):
+    out = subprocess.run([sys.executable, '-c', IMPORT_PROBE], cwd=ROOT, capture_output=True, text=True,
+                         env={**env, 'WARMUP': '1' if warmup else '0'}, check=True)
+    return {k: round(v * 1000, 1) for k, v in json.loads(out.stdout.strip().splitlines()[-1]).items()}
+
+
+def run_gunicorn(env, workers, preload):
+    port = free_port()
+    cmd = [sys.executable, '-m', 'gunicorn', '-w', str(workers), '-b', f'127.0.0.1:{port}',
+           '--access-logfile', '/dev/null', 'server.wsgi:app']
+    if preload:
+        cmd[3:3] = ['-c', 'server/gunicorn.conf.py']
+    started = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        ready = None
+        while time.perf_counter() - started < 120:
+            try:
+                urllib.request.urlopen(f'http://127.0.0.1:{port}/ports', timeout=1).read()
+                ready = time.perf_counter() - started
+                break
+            except OSError:
+                time.sleep(0.02)
+        # Let every worker finish booting before measuring it.
+        deadline = time.perf_counter() + 60
+        while len(children(proc.pid)) < workers and time.perf_counter() < deadline:
+            time.sleep(0.05)
+        time.sleep(1.0)
+        for _ in range(workers * 4):
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/port_pairs', timeout=10).read()
+        master = memory_kb(proc.pid)
+        worker_mem = [memory_kb(pid) for pid in children(proc.pid)]
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(30)
+    return {
+        'ready_s': round(ready, 2) if ready is not None else None,
+        'master_rss_mb': round(master['rss'] / 1024, 1),
+        'worker_rss_mb': round(sum(m['rss'] for m in worker_mem) / len(worker_mem) / 1024, 1),
+        'worker_pss_mb': round(sum(m['pss'] for m in worker_mem) / len(worker_mem) / 1024, 1),
+        'total_pss_mb': round((master['pss'] + sum(m['pss'] for m in worker_mem)) / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--ports', type=int, default=2000)
+    parser.add_argument('--lanes-per-port', type=int, default=10)
+    parser.add_argument('--container-types', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--output', help='write the results as JSON here')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    env = {**os.environ,
+           'DATABASE_URL': 'sqlite:///' + os.path.join(tmp, 'cold_start.db'),
+           'TABLE_VERSIONS_PATH': os.path.join(tmp, 'versions')}
+    subprocess.run([sys.executable, '-m', 'server.seed', '--ports', str(args.ports),
+                    '--lanes-per-port', str(args.lanes_per_port),
+                    '--container-types', str(args.container_types)],
+                   cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+
+    results = {'import': {}, 'gunicorn': {}}
+    for warmup in (False, True):
+        name = 'warmup' if warmup else 'no_warmup'
+        results['import'][name] = r = probe_import(env, warmup)
+        print(f"import {name:<10} import {r['import_s']:>8.1f} ms   first /port_pairs "
+              f"{r['first_port_pairs_s']:>7.1f} ms   first /rates {r['first_rates_s']:>7.1f} ms")
+    for preload in (False, True):
+        name = 'preload' if preload else 'per_worker'
+        results['gunicorn'][name] = r = run_gunicorn(env, args.workers, preload)
+        print(f"gunicorn {name:<10} ready {r['ready_s']}s   worker RSS {r['worker_rss_mb']} MB   "
+              f"worker PSS {r['worker_pss_mb']} MB   pool PSS {r['total_pss_mb']} MB")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
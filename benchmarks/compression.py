@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""Bytes on the wire and CPU per request for each response encoding.
+
+Seeds a fresh SQLite database with server/seed.py, logs a user in, and
+requests each path below with ``Accept-Encoding`` set to identity, gzip and
+(if the brotli package is installed) br, through the in-process WSGI test
+client. CPU is process time per request after one warm-up request, so
+cached reference lists show the cost of serving stored compressed bytes;
+the ``compress ms`` column is what compressing that body on every request
+would cost instead. A second table compares JSON serializers on the largest
+payload.
+
+    python -m benchmarks.compression --ports 2000 --repeat 20
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'compression.db'))
+os.environ.setdefault('TABLE_VERSIONS_PATH', os.path.join(tempfile.mkdtemp(), 'versions'))
+os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+os.environ.setdefault('RATE_LIMITS_ENABLED', '0')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from server.app import app  # noqa: E402
+from server.config import db  # noqa: E402
+from server.encoding import brotli, compress, orjson  # noqa: E402
+from server.seed import seed, PASSWORD  # noqa: E402
+
+PATHS = [
+    '/ports',
+    '/port_pairs',
+    '/rates',
+    '/rates?port_pair_id=1',
+    '/bootstrap',
+    '/quotes',
+    '/quotes/export?format=ndjson',
+]
+
+
+def cpu_ms(fn, repeat):
+    started = time.process_time()
+    for _ in range(repeat):
+        result = fn()
+    return (time.process_time() - started) / repeat * 1000, result
+
+
+def measure(client, path, encoding, repeat):
+    headers = {'Accept-Encoding': encoding}
+
+    def get():
+        resp = client.get(path, headers=headers)
+        # Reading the body runs streamed responses to the end.
+        return resp, resp.get_data()
+
+    get()
+    cpu, (resp, body) = cpu_ms(get, repeat)
+    return {
+        'status': resp.status_code,
+        'content_encoding': resp.headers.get('Content-Encoding', 'identity'),
+        'bytes': len(body),
+        'cpu_ms': round(cpu, 3),
+    }
+
+
+def serializers(data, repeat):
+    candidates = {
+        'json default separators': lambda: json.dumps(data).encode('utf-8'),
+        'json compact': lambda: json.dumps(data, separators=(',', ':')).encode('utf-8'),
+    }
+    if orjson is not None:
+        candidates['orjson'] = lambda: orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    results = {}
+    for name, fn in candidates.items():
+        cpu, body = cpu_ms(fn, repeat)
+        results[name] = {'bytes': len(body), 'cpu_ms': round(cpu, 3)}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--ports', type=int, default=1000)
+    parser.add_argument('--lanes-per-port', type=int, default=5)
+    parser.add_argument('--container-types', type=int, default=4)
+    parser.add_argument('--rates-per-lane', type=int, default=2)
+    parser.add_argument('--quotes-per-user', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--output', help='write the results as JSON here')
+    args = parser.parse_args()
+
+    with app.app_context():
+        counts, seconds = seed(argparse.Namespace(
+            seed=args.seed, ports=args.ports, lanes_per_port=args.lanes_per_port,
+            container_types=args.container_types, rates_per_lane=args.rates_per_lane,
+            users=1, quotes_per_user=args.quotes_per_user, lines_per_quote=3, batch_size=50000))
+        email = db.session.execute(db.text('SELECT email FROM users')).scalar()
+        db.session.remove()
+    print(f"seeded {counts} in {seconds:.1f}s")
+
+    client = app.test_client()
+    client.post('/auth/login', json={'email': email, 'password': PASSWORD})
+    encodings = ['identity', 'gzip'] + (['br'] if brotli is not None else [])
+
+    results = {'endpoints': {}, 'serializers': {}}
+    print(f"{'path':<30}{'encoding':>10}{'bytes':>12}{'ratio':>8}{'cpu ms':>10}{'compress ms':>13}")
+    largest = None
+    for path in PATHS:
+        rows = results['endpoints'][path] = {}
+        plain = None
+        for encoding in encodings:
+            row = rows[encoding] = measure(client, path, encoding, args.repeat)
+            if encoding == 'identity':
+                plain = client.get(path, headers={'Accept-Encoding': 'identity'}).data
+                if largest is None or len(plain) > len(largest[1]):
+                    largest = (path, plain)
+                extra = ''
+            else:
+                cpu, _ = cpu_ms(lambda: compress(plain, encoding), args.repeat)
+                row['compress_ms'] = round(cpu, 3)
+                extra = f"{cpu:>13.3f}"
+            ratio = row['bytes'] / len(plain) if plain else 1.0
+            print(f"{path:<30}{row['content_encoding']:>10}{row['bytes']:>12}{ratio:>8.3f}"
+                  f"{row['cpu_ms']:>10.3f}{extra}")
+
+    path, body = largest
+    print(f"\nserializing {path} ({len(body)} bytes compact)")
+    results['serializers'] = serializers(json.loads(body), args.repeat)
+    for name, row in results['serializers'].items():
+        print(f"{name:<26}{row['bytes']:>12}{row['cpu_ms']:>10.3f} ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
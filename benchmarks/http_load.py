@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""Latency, throughput and SQL count of the main API endpoints under a
+realistic request mix.
+
+Seeds a fresh SQLite database with server/seed.py at the requested scale,
+logs a pool of users in, and replays a weighted mix of the requests the
+client makes through the in-process WSGI test client. Like a browser, each
+user revalidates cached GETs with If-None-Match. Warmup requests are not
+measured.
+
+Results go to --output as JSON. With --baseline (default
+benchmarks/baselines/http_load.json, if present) the run exits 1 when an
+endpoint errors, needs more SQL for a single request than the baseline did, or its p50/p95
+grows by more than --tolerance. --save-baseline records this run instead.
+
+    python -m benchmarks.http_load --ports 2000 --requests 5000
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'http_load.db'))
+os.environ.setdefault('TABLE_VERSIONS_PATH', os.path.join(tempfile.mkdtemp(), 'versions'))
+# Login latency at production bcrypt cost would measure bcrypt, not the API.
+os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+# Every simulated user logs in from the same address; the other budgets
+# are per user and stay at their defaults, so the limiter is measured too.
+os.environ.setdefault('RATE_LIMIT_AUTH', '1000/60')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import event  # noqa: E402
+
+from server.app import app  # noqa: E402
+from server.config import db  # noqa: E402
+from server.seed import seed, PASSWORD  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baselines', 'http_load.json')
+
+# endpoint -> relative weight in the mix
+MIX = {
+    'login': 1,
+    'port_pairs': 10,
+    'rates': 40,
+    'quotes': 15,
+    'quote_detail': 30,
+}
+
+
+class User:
+    def __init__(self, email):
+        self.email = email
+        self.client = app.test_client()
+        self.etags = {}
+        self.quote_ids = []
+
+
+class Workload:
+    def __init__(self, rng, users, data):
+        self.rng = rng
+        self.users = users
+        self.lanes = data['lanes']
+        self.container_types = data['container_types']
+
+    def request(self, endpoint):
+        user = self.rng.choice(self.users)
+        if endpoint == 'login':
+            # A fresh client, so the pool's sessions stay logged in.
+            resp = app.test_client().post('/auth/login', json={'email': user.email, 'password': PASSWORD})
+            return resp.status_code
+        if endpoint == 'port_pairs':
+            return self.get(user, '/port_pairs')
+        if endpoint == 'rates':
+            ppid = self.rng.choice(self.lanes)
+            ctid = self.rng.choice(self.container_types)
+            return self.get(user, f'/rates?port_pair_id={ppid}&container_type_id={ctid}')
+        if endpoint == 'quotes':
+            return self.get(user, '/quotes')
+        if endpoint == 'quote_detail':
+            if not user.quote_ids:
+                return self.get(user, '/quotes')
+            return self.get(user, f'/quotes/{self.rng.choice(user.quote_ids)}')
+        raise ValueError(endpoint)
+
+    def get(self, user, path):
+        headers = {'Accept-Encoding': 'gzip'}
+        if path in user.etags:
+            headers['If-None-Match'] = user.etags[path]
+        resp = user.client.get(path, headers=headers)
+        if resp.headers.get('ETag'):
+            user.etags[path] = resp.headers['ETag']
+        return resp.status_code
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(round(p / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def summarize(samples, wall):
+    endpoints = {}
+    for endpoint, rows in samples.items():
+        latencies = sorted(r[0] for r in rows)
+        total = sum(latencies)
+        endpoints[endpoint] = {
+            'requests': len(rows),
+            'errors': sum(1 for r in rows if r[2] >= 400),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+            'mean_ms': round(total / len(rows) * 1000, 3) if rows else 0.0,
+            'rps': round(len(rows) / total, 1) if total else 0.0,
+            'queries_per_request': round(sum(r[1] for r in rows) / len(rows), 3) if rows else 0.0,
+            'max_queries': max((r[1] for r in rows), default=0),
+        }
+    count = sum(len(rows) for rows in samples.values())
+    return {'requests': count, 'seconds': round(wall, 3), 'rps': round(count / wall, 1), 'endpoints': endpoints}
+
+
+def compare(results, baseline, tolerance):
+    failures = []
+    for endpoint, current in results['endpoints'].items():
+        if current['errors']:
+            failures.append(f"{endpoint}: {current['errors']} error responses")
+        base = baseline['endpoints'].get(endpoint)
+        if base is None:
+            continue
+        # The mean depends on how often caches miss; the worst case does not.
+        if current['max_queries'] > base['max_queries']:
+            failures.append(f"{endpoint}: up to {current['max_queries']} queries/request "
+                            f"(baseline {base['max_queries']})")
+        for key in ('p50_ms', 'p95_ms'):
+            if current[key] > base[key] * (1 + tolerance):
+                failures.append(f"{endpoint}: {key} {current[key]} (baseline {base[key]})")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--ports', type=int, default=500)
+    parser.add_argument('--lanes-per-port', type=int, default=5)
+    parser.add_argument('--container-types', type=int, default=4)
+    parser.add_argument('--rates-per-lane', type=int, default=2)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--quotes-per-user', type=int, default=20)
+    parser.add_argument('--lines-per-quote', type=int, default=3)
+    parser.add_argument('--requests', type=int, default=3000)
+    parser.add_argument('--warmup', type=int, default=200)
+    parser.add_argument('--output', default='http_load_results.json')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='allowed relative growth of p50/p95 over the baseline')
+    parser.add_argument('--save-baseline', action='store_true')
+    args = parser.parse_args()
+
+    with app.app_context():
+        counts, seconds = seed(argparse.Namespace(
+            seed=args.seed, ports=args.ports, lanes_per_port=args.lanes_per_port,
+            container_types=args.container_types, rates_per_lane=args.rates_per_lane,
+            users=args.users, quotes_per_user=args.quotes_per_user,
+            lines_per_quote=args.lines_per_quote, batch_size=50000))
+        print(f"seeded {counts} in {seconds:.1f}s")
+        data = {
+            'lanes': [r[0] for r in db.session.execute(db.text('SELECT id FROM port_pairs'))],
+            'container_types': [r[0] for r in db.session.execute(db.text('SELECT id FROM container_types'))],
+        }
+        emails = [r[0] for r in db.session.execute(db.text('SELECT email FROM users ORDER BY id'))]
+        db.session.remove()
+        engine = db.engine
+
+    queries = [0]
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def count(*_):
+        queries[0] += 1
+
+    users = []
+    for email in emails:
+        user = User(email)
+        user.client.post('/auth/login', json={'email': email, 'password': PASSWORD})
+        user.quote_ids = [q['id'] for q in user.client.get('/quotes').get_json()]
+        users.append(user)
+
+    rng = random.Random(args.seed)
+    workload = Workload(rng, users, data)
+    endpoints = list(MIX)
+    weights = [MIX[e] for e in endpoints]
+    for endpoint in rng.choices(endpoints, weights, k=args.warmup):
+        workload.request(endpoint)
+
+    samples = {e: [] for e in endpoints}
+    started = time.perf_counter()
+    for endpoint in rng.choices(endpoints, weights, k=args.requests):
+        before = queries[0]
+        t0 = time.perf_counter()
+        status = workload.request(endpoint)
+        samples[endpoint].append((time.perf_counter() - t0, queries[0] - before, status))
+    results = summarize(samples, time.perf_counter() - started)
+    results['config'] = {k: v for k, v in vars(args).items()
+                         if k not in ('output', 'baseline', 'save_baseline', 'tolerance')}
+    results['dataset'] = counts
+    results['python'] = platform.python_version()
+
+    print(f"{'endpoint':<14}{'n':>6}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'rps':>9}{'sql/req':>9}")
+    for endpoint, r in results['endpoints'].items():
+        print(f"{endpoint:<14}{r['requests']:>6}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}"
+              f"{r['p99_ms']:>9.2f}{r['rps']:>9.0f}{r['queries_per_request']:>9.2f}")
+    print(f"total: {results['requests']} requests in {results['seconds']}s ({results['rps']} req/s)")
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('config') != results['config']:
+        print("warning: baseline was recorded with different settings")
+    failures = compare(results, baseline, args.tolerance)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+"""Fail if a hot endpoint's SQL falls back to a full table scan.
+
+The cases live in tests/test_query_plans.py; this runs just them.
+
+    python -m benchmarks.query_plans
+"""
+import os
+import sys
+
+import pytest
+
+TESTS = os.path.join(os.path.dirname(__file__), '..', 'tests', 'test_query_plans.py')
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main(['-q', TESTS] + sys.argv[1:]))
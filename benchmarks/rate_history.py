@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Rate lookups, now and as of a past date, as superseded tariffs pile up.
+
+For each history depth, seeds a fresh SQLite database with server/seed.py
+(every rate slot gets that many expired monthly tariffs before the current
+one), then times the rate index load, the cheapest rate on random lanes now
+and as of a random past month, and the SQL as-of export of one lane. Flat
+lookup times across depths are the point; the load grows with the rows.
+Finally it archives all expired rates and reloads the index.
+
+    python -m benchmarks.rate_history --ports 500 --depths 0 12 48
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'rate_history.db'))
+os.environ.setdefault('TABLE_VERSIONS_PATH', os.path.join(tempfile.mkdtemp(), 'versions'))
+os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import select  # noqa: E402
+
+from server.app import app  # noqa: E402
+from server.compaction import compact_rates  # noqa: E402
+from server.config import db  # noqa: E402
+from server.models import Rate  # noqa: E402
+from server.rate_index import rate_index  # noqa: E402
+from server.seed import seed, TARIFF_START, TARIFF_LENGTH  # noqa: E402
+from server.validity import valid_at  # noqa: E402
+
+
+def per_call_us(fn, args):
+    started = time.perf_counter()
+    for a in args:
+        fn(*a)
+    return (time.perf_counter() - started) / len(args) * 1e6
+
+
+def measure(args, depth):
+    counts, _ = seed(argparse.Namespace(
+        seed=args.seed, ports=args.ports, lanes_per_port=args.lanes_per_port,
+        container_types=args.container_types, rates_per_lane=args.rates_per_lane,
+        history=depth, users=1, quotes_per_user=0, lines_per_quote=0, batch_size=50000))
+    db.session.remove()
+
+    started = time.perf_counter()
+    rate_index.ensure_loaded()
+    load_s = time.perf_counter() - started
+
+    rng = random.Random(args.seed)
+    index = rate_index.view()
+    lanes = list(index._lanes)
+    sample = [rng.choice(lanes) for _ in range(args.lookups)]
+    months = max(depth, 1)
+    past = [TARIFF_START - rng.randint(1, months) * TARIFF_LENGTH + TARIFF_LENGTH / 2
+            for _ in range(args.lookups)]
+    as_of = lambda o, d, ct, t: index.best(o, d, ct, as_of=t)
+    past_sample = [lane + (t,) for lane, t in zip(sample, past)]
+    # The first lookup in a time segment sorts it; time the warm ones.
+    per_call_us(index.best, sample)
+    per_call_us(as_of, past_sample)
+    now_us = per_call_us(index.best, sample)
+    as_of_us = per_call_us(as_of, past_sample)
+
+    pp, ct = db.session.execute(select(Rate.port_pair_id, Rate.container_type_id).limit(1)).one()
+    stmt = select(Rate.id).where(Rate.port_pair_id == pp, Rate.container_type_id == ct, valid_at(past[0]))
+    started = time.perf_counter()
+    for _ in range(args.lookups // 10):
+        db.session.execute(stmt).all()
+    sql_us = (time.perf_counter() - started) / (args.lookups // 10) * 1e6
+    db.session.remove()
+    return {
+        'rates': counts['rates'] + counts.get('superseded_rates', 0),
+        'load_s': load_s, 'best_now_us': now_us, 'best_as_of_us': as_of_us, 'sql_as_of_us': sql_us,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--ports', type=int, default=500)
+    parser.add_argument('--lanes-per-port', type=int, default=5)
+    parser.add_argument('--container-types', type=int, default=4)
+    parser.add_argument('--rates-per-lane', type=int, default=2)
+    parser.add_argument('--depths', type=int, nargs='+', default=[0, 12, 48])
+    parser.add_argument('--lookups', type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'history':>8}{'rates':>10}{'load s':>9}{'best now us':>13}{'best as_of us':>15}{'sql as_of us':>14}")
+    with app.app_context():
+        for depth in args.depths:
+            r = measure(args, depth)
+            print(f"{depth:>8}{r['rates']:>10}{r['load_s']:>9.2f}{r['best_now_us']:>13.2f}"
+                  f"{r['best_as_of_us']:>15.2f}{r['sql_as_of_us']:>14.1f}")
+
+        started = time.perf_counter()
+        archived = compact_rates(TARIFF_START)
+        compact_s = time.perf_counter() - started
+        started = time.perf_counter()
+        rate_index.ensure_loaded()
+        print(f"\narchived {archived} expired rates in {compact_s:.2f}s; "
+              f"index reload {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
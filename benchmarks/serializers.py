@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Compare SerializerMixin.to_dict with the precompiled serializers.
+
+Builds an in-memory SQLite database with N quotes of several lines each,
+loads them once with the plan's eager-load options, then times both
+serializers on the same loaded objects and checks their output matches.
+
+    python -m benchmarks.serializers --quotes 500 --lines 5
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from server.app import app  # noqa: E402
+from server.config import db  # noqa: E402
+from server.models import User, Port, PortPair, ContainerType, Rate, Quote, QuoteRate  # noqa: E402
+from server.serializers import to_dicts, load_options  # noqa: E402
+
+
+def seed(n_quotes, n_lines):
+    rng = random.Random(0)
+    user = User(email='bench@example.com', password_hash='x')
+    ports = [Port(name=f'Port {i}', code=f'BP{i:03d}') for i in range(20)]
+    db.session.add_all([user] + ports)
+    db.session.flush()
+    pairs = [PortPair(origin_port_id=ports[i].id, destination_port_id=ports[i + 1].id)
+             for i in range(len(ports) - 1)]
+    types = [ContainerType(code='20GP'), ContainerType(code='40HC')]
+    db.session.add_all(pairs + types)
+    db.session.flush()
+    rates = [Rate(port_pair_id=pp.id, container_type_id=ct.id,
+                  base_rate=rng.randint(500, 2000), transit_days=rng.randint(5, 30))
+             for pp in pairs for ct in types for _ in range(5)]
+    db.session.add_all(rates)
+    db.session.flush()
+    for i in range(n_quotes):
+        q = Quote(title=f'Quote {i}', status='Confirmed', user_id=user.id)
+        db.session.add(q)
+        db.session.flush()
+        for r in rng.sample(rates, n_lines):
+            db.session.add(QuoteRate(quote_id=q.id, rate_id=r.id))
+    db.session.commit()
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--quotes', type=int, default=500)
+    parser.add_argument('--lines', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        seed(args.quotes, args.lines)
+        for rules in ((), ('-quote_rates',)):
+            quotes = Quote.query.options(*load_options(Quote, rules=rules)).all()
+            old_t, old = timed(lambda: [q.to_dict(rules=rules) for q in quotes], args.repeat)
+            new_t, new = timed(lambda: to_dicts(quotes, rules=rules), args.repeat)
+            same = json.dumps(old, sort_keys=True) == json.dumps(new, sort_keys=True)
+            print(f"Quote rules={rules!r:12} to_dict {old_t * 1000:8.1f} ms  "
+                  f"compiled {new_t * 1000:7.1f} ms  x{old_t / new_t:5.1f}  identical={same}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Read/write throughput of several SQLite worker processes, before and after
+the pragma profile in server/config.py.
+
+Each worker opens its own connection and, for a fixed time, runs a mix of
+lane lookups and single-row rate inserts, committing every write like the
+API does. "default" connects the way SQLAlchemy does out of the box;
+"tuned" applies SQLITE_PRAGMAS on connect.
+
+    python -m benchmarks.sqlite_concurrency --workers 8 --seconds 5
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import create_engine, insert  # noqa: E402
+
+from server.config import db, apply_sqlite_pragmas  # noqa: E402
+from server.models import Port, PortPair, ContainerType, Rate  # noqa: E402
+
+LANES = 200
+TYPES = 2
+
+
+def build(path, rates):
+    engine = create_engine(f'sqlite:///{path}')
+    db.metadata.create_all(engine)
+    rng = random.Random(0)
+    with engine.begin() as conn:
+        conn.execute(insert(Port), [{'id': i, 'name': f'P{i}', 'code': f'P{i:04d}'} for i in range(LANES + 1)])
+        conn.execute(insert(PortPair), [{'id': i + 1, 'origin_port_id': i, 'destination_port_id': i + 1}
+                                        for i in range(LANES)])
+        conn.execute(insert(ContainerType), [{'id': i + 1, 'code': f'C{i}'} for i in range(TYPES)])
+        conn.execute(insert(Rate), [{'port_pair_id': rng.randint(1, LANES), 'container_type_id': rng.randint(1, TYPES),
+                                     'base_rate': rng.randint(100, 5000), 'transit_days': rng.randint(1, 40)}
+                                    for _ in range(rates)])
+    engine.dispose()
+
+
+def worker(path, tuned, seconds, write_ratio, seed, results):
+    conn = sqlite3.connect(path, timeout=5.0)
+    if tuned:
+        apply_sqlite_pragmas(conn)
+    rng = random.Random(seed)
+    reads = writes = locked = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        try:
+            if rng.random() < write_ratio:
+                conn.execute(
+                    'INSERT INTO rates (port_pair_id, container_type_id, base_rate, transit_days) VALUES (?, ?, ?, ?)',
+                    (rng.randint(1, LANES), rng.randint(1, TYPES), rng.randint(100, 5000), rng.randint(1, 40)))
+                conn.commit()
+                writes += 1
+            else:
+                conn.execute(
+                    'SELECT id, base_rate, transit_days FROM rates WHERE port_pair_id = ? AND container_type_id = ? '
+                    'ORDER BY base_rate LIMIT 20', (rng.randint(1, LANES), rng.randint(1, TYPES))).fetchall()
+                reads += 1
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            conn.rollback()
+            locked += 1
+    conn.close()
+    results.put((reads, writes, locked))
+
+
+def run(profile, args):
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    build(path, args.rates)
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=worker,
+                                     args=(path, profile == 'tuned', args.seconds, args.write_ratio, i, results))
+             for i in range(args.workers)]
+    for p in procs:
+        p.start()
+    totals = [sum(x) for x in zip(*[results.get() for _ in procs])]
+    for p in procs:
+        p.join()
+    reads, writes, locked = totals
+    print(f'{profile:8} reads/s {reads / args.seconds:10.0f}  writes/s {writes / args.seconds:8.0f}  '
+          f'"database is locked" {locked}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--rates', type=int, default=50000)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    args = parser.parse_args()
+    for profile in ('default', 'tuned'):
+        run(profile, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -41,16 +41,9 @@ export default function AdminData({ user }) {
 
   const loadLookups = useCallback(async () => {
     try {
-      const [pr, ppr, tr] = await Promise.all([
-        apiFetch('/ports'),
-        apiFetch('/port_pairs'),
-        apiFetch('/container_types'),
-      ]);
-      const [portsData, pairsData, typesData] = await Promise.all([
-        pr.ok ? pr.json() : [],
-        ppr.ok ? ppr.json() : [],
-        tr.ok ? tr.json() : [],
-      ]);
+      const r = await apiFetch('/bootstrap?include=ports,port_pairs,container_types');
+      const data = r.ok ? await r.json() : {};
+      const { ports: portsData, port_pairs: pairsData, container_types: typesData } = data;
       setPorts(Array.isArray(portsData) ? portsData : []);
       setPortPairs(Array.isArray(pairsData) ? pairsData : []);
       setTypes(Array.isArray(typesData) ? typesData : []);
@@ -252,6 +245,8 @@ export default function AdminData({ user }) {
             container_type_id: '',
             transit_days: '',
             base_rate: '',
+            effective_from: '',
+            supersede: false,
           }}
           validationSchema={RateSchema}
           onSubmit={async (values, { resetForm, setSubmitting }) => {
@@ -262,7 +257,9 @@ export default function AdminData({ user }) {
                 container_type_id: Number(values.container_type_id),
                 transit_days: Number(values.transit_days),
                 base_rate: Number(values.base_rate),
+                supersede: values.supersede,
               };
+              if (values.effective_from) body.effective_from = values.effective_from;
               await postJSON('/rates', body);
               resetForm();
               await loadLookups();
@@ -306,6 +303,13 @@ export default function AdminData({ user }) {
               <Field name="base_rate" type="number" min="1" />
               <ErrorMessage name="base_rate" component="div" className="error" />
 
+              <label>Effective From</label>
+              <Field name="effective_from" type="date" />
+
+              <label>
+                <Field name="supersede" type="checkbox" /> Replaces this lane's current rates
+              </label>
+
               <button type="submit" className="btn" disabled={isSubmitting}>
                 Add Rate
               </button>
@@ -18,25 +18,15 @@ export default function NewQuote({ user }) {
   const [rates, setRates] = useState([]);
 
   useEffect(() => {
-    apiFetch('/port_pairs')
-      .then((r) => (r.ok ? r.json() : Promise.resolve([])))
+    apiFetch('/bootstrap?include=port_pairs,container_types')
+      .then((r) => (r.ok ? r.json() : Promise.resolve({})))
       .then((data) => {
-        console.log('port_pairs:', data);
-        setPairs(Array.isArray(data) ? data : []);
+        setPairs(Array.isArray(data.port_pairs) ? data.port_pairs : []);
+        setTypes(Array.isArray(data.container_types) ? data.container_types : []);
       })
       .catch((e) => {
-        console.error('port_pairs error', e);
+        console.error('bootstrap error', e);
         setPairs([]);
-      });
-
-    apiFetch('/container_types')
-      .then((r) => (r.ok ? r.json() : Promise.resolve([])))
-      .then((data) => {
-        console.log('container_types:', data);
-        setTypes(Array.isArray(data) ? data : []);
-      })
-      .catch((e) => {
-        console.error('container_types error', e);
         setTypes([]);
       });
   }, []);
@@ -1,5 +1,5 @@
 import { apiFetch } from '../api';
-import React, { useEffect, useState } from 'react';
+import React, { useCallback, useEffect, useState } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import { Formik, Form, Field, ErrorMessage } from 'formik';
 import * as Yup from 'yup';
@@ -14,8 +14,10 @@ export default function QuoteDetail({ user }) {
   const nav = useNavigate();
   const [quote, setQuote] = useState(null);
   const [status, setStatus] = useState('');
+  const [conflict, setConflict] = useState(false);
 
-  useEffect(() => {
+  const load = useCallback(() => {
+    setConflict(false);
     apiFetch(`/quotes/${id}`)
       .then((r) => (r.ok ? r.json() : Promise.resolve({ error: r.status })))
       .then((data) => {
@@ -28,13 +30,15 @@ export default function QuoteDetail({ user }) {
       });
   }, [id]);
 
+  useEffect(load, [load]);
+
   if (!quote) return <p>{status || 'Loading…'}</p>;
 
   const isOwner = user && user.id === quote.user_id;
 
-  const rates = Array.isArray(quote.rates) ? quote.rates : [];
+  const rates = Array.isArray(quote.quote_rates) ? quote.quote_rates : [];
   const formattedRates = rates
-    .map((rate) => `$${rate.base_rate} — ${rate.transit_days} days`)
+    .map((line) => `${line.quantity > 1 ? `${line.quantity} × ` : ''}${line.origin_code} → ${line.destination_code} ${line.container_code}: $${line.base_rate} — ${line.transit_days} days`)
     .join(' • ');
 
   async function handleDelete() {
@@ -65,6 +69,11 @@ export default function QuoteDetail({ user }) {
         <p>
           <strong>Rate:</strong> {rates.length === 0 ? 'None' : formattedRates}
         </p>
+        {rates.length > 0 && (
+          <p>
+            <strong>Total:</strong> ${quote.total_base_rate} — up to {quote.max_transit_days} days
+          </p>
+        )}
         {isOwner && (
           <>
             <div className="form-container">
@@ -74,15 +83,29 @@ export default function QuoteDetail({ user }) {
                 enableReinitialize
                 validationSchema={EditSchema}
                 onSubmit={async (values) => {
+                  // The version we loaded: the server answers 409 if the
+                  // quote was saved by someone else since.
                   const res = await apiFetch(`/quotes/${id}`, {
                     method: 'PATCH',
-                    body: JSON.stringify(values),
+                    body: JSON.stringify({ ...values, version: quote.version }),
                   });
+                  if (res.status === 409) {
+                    setConflict(true);
+                    return;
+                  }
                   const data = await res.json();
-                  setQuote(data);
+                  if (res.ok) setQuote(data);
                 }}
               >
                 <Form>
+                  {conflict && (
+                    <div className="error">
+                      This quote was changed elsewhere since you opened it.{' '}
+                      <button className="btn" type="button" onClick={load}>
+                        Reload
+                      </button>
+                    </div>
+                  )}
                   <label>Title</label>
                   <Field name="title" />
                   <ErrorMessage name="title" component="div" className="error" />
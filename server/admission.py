@@ -0,0 +1,199 @@
+"""Per-client rate limits and per-worker load shedding.
+
+Every request is charged to a token bucket for its budget class (``auth``,
+``read``, ``write`` or ``bulk``). A resource picks the class per method
+with a ``rate_limits`` attribute, e.g. ``{"post": "auth"}``; otherwise GETs
+are reads and everything else is a write. Logged-in requests are charged to
+their user and anonymous ones to the client IP; ``auth`` requests are also
+charged to the IP, so one address cannot walk through many accounts. An
+empty bucket answers 429 with ``Retry-After``.
+
+Buckets live in a memory-mapped file shared by every worker process, as
+``table_versions`` does, and are updated under ``flock``. The table has a
+fixed number of slots; when a key's probe window is full the least recently
+used bucket in it is recycled, which only ever makes a limit more lenient.
+
+Each worker also counts its requests in flight. Past ``MAX_IN_FLIGHT`` it
+answers 503, and writes are shed earlier, at ``SHED_WRITES_AT`` of the cap,
+so reads keep flowing while writes back off.
+"""
+import fcntl
+import functools
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+from flask import g, request, session
+
+try:
+    from .config import app
+    from .versions import default_path
+except ImportError:
+    from config import app
+    from versions import default_path
+
+SLOTS = 1 << 16
+# Slots tried for a key before the oldest of them is recycled.
+PROBES = 8
+# key hash, tokens left, time of last update
+_SLOT = struct.Struct('<Qdd')
+
+
+@functools.lru_cache(maxsize=None)
+def parse_budget(value):
+    """``"<requests>/<seconds>"`` -> ``(burst, tokens per second)``."""
+    requests, _, seconds = value.partition('/')
+    burst = float(requests)
+    return burst, burst / float(seconds or 1)
+
+
+class TokenBuckets:
+    def __init__(self, path, slots=SLOTS):
+        self.path = path
+        self.slots = slots
+        self._lock = threading.Lock()
+        self._open()
+
+    def _open(self):
+        size = _SLOT.size * self.slots
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._map = mmap.mmap(self._fd, size)
+
+    def reopen(self):
+        """Open a descriptor of our own after fork (see TableVersions.reopen)."""
+        self._lock = threading.Lock()
+        self._map.close()
+        os.close(self._fd)
+        self._open()
+
+    def take(self, key, burst, rate, now=None):
+        """Take one token from ``key``'s bucket.
+
+        Returns 0 if it was granted, else the seconds until one is available.
+        """
+        now = time.time() if now is None else now
+        h = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little') or 1
+        first = h % self.slots
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                oldest = None
+                for i in range(PROBES):
+                    offset = ((first + i) % self.slots) * _SLOT.size
+                    slot_key, tokens, stamp = _SLOT.unpack_from(self._map, offset)
+                    if slot_key == h:
+                        break
+                    if slot_key == 0:
+                        tokens, stamp = burst, now
+                        break
+                    if oldest is None or stamp < oldest[1]:
+                        oldest = (offset, stamp)
+                else:
+                    offset, tokens, stamp = oldest[0], burst, now
+
+                # A clock that went backwards refills nothing.
+                tokens = min(burst, tokens + max(0.0, now - stamp) * rate)
+                wait = 0.0
+                if tokens >= 1:
+                    tokens -= 1
+                else:
+                    wait = (1 - tokens) / rate
+                _SLOT.pack_into(self._map, offset, h, tokens, now)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return wait
+
+
+class Admission:
+    """This worker's requests in flight and what it turned away."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.shed = 0
+        self.limited = {}
+
+    def enter(self, limit):
+        with self._lock:
+            if self.in_flight >= limit:
+                self.shed += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def rate_limited(self, cls):
+        with self._lock:
+            self.limited[cls] = self.limited.get(cls, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': self.in_flight,
+                'shed': self.shed,
+                'rate_limited': dict(self.limited),
+            }
+
+
+buckets = TokenBuckets(
+    app.config.get('RATE_LIMIT_PATH')
+    or default_path(app.config['SQLALCHEMY_DATABASE_URI'], 'ratelimits')
+)
+os.register_at_fork(after_in_child=buckets.reopen)
+admission = Admission()
+
+
+def budget_class(view_class, method):
+    limits = getattr(view_class, 'rate_limits', None) or {}
+    return limits.get(method.lower()) or ('read' if method in ('GET', 'HEAD') else 'write')
+
+
+def _retry_after(seconds):
+    return str(max(1, math.ceil(seconds)))
+
+
+@app.before_request
+def _admit():
+    if request.method == 'OPTIONS' or request.endpoint is None:
+        return None
+    view_class = getattr(app.view_functions.get(request.endpoint), 'view_class', None)
+    cls = budget_class(view_class, request.method)
+
+    cap = app.config['MAX_IN_FLIGHT']
+    if cap:
+        limit = cap if cls == 'read' else max(1, int(cap * app.config['SHED_WRITES_AT']))
+        if not admission.enter(limit):
+            return {"error": "server busy, try again"}, 503, {"Retry-After": "1"}
+        g.in_flight = True
+
+    if app.config['RATE_LIMITS_ENABLED']:
+        burst, rate = parse_budget(app.config['RATE_LIMITS'][cls])
+        ip = request.remote_addr or 'unknown'
+        uid = session.get('user_id')
+        keys = [f'{cls}:user:{uid}' if uid else f'{cls}:ip:{ip}']
+        if cls == 'auth' and uid:
+            keys.append(f'{cls}:ip:{ip}')
+        wait = max(buckets.take(key, burst, rate) for key in keys)
+        if wait:
+            admission.rate_limited(cls)
+            return {"error": "rate limit exceeded"}, 429, {"Retry-After": _retry_after(wait)}
+    return None
+
+
+@app.teardown_request
+def _release(exc):
+    if g.pop('in_flight', False):
+        admission.leave()
@@ -1,34 +1,81 @@
 #!/usr/bin/env python3
 
 # Standard library imports
+from datetime import timedelta
 
 # Remote library imports
-from flask import request, session
+import click
+from flask import Response, abort, g, request, session
 from flask_restful import Resource
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import aliased
+from sqlalchemy.orm.exc import StaleDataError
 
 try:
     from .config import app, db, api
     from .models import User, Port, PortPair, ContainerType, Rate, Quote, QuoteRate
+    from .rate_index import rate_index
+    from .rate_import import RateImport, parse_csv, parse_ndjson
+    from .serializers import to_dict, to_dicts, load_options, field_names
+    from .versions import table_versions
+    from .http_cache import cached_json, cached_blob
+    from .passwords import password_hasher, PasswordHasherBusy
+    from .metrics import metrics, password_hashing_lines, admission_lines
+    from .admission import admission
+    from .exports import stream_export, FORMATS as EXPORT_FORMATS
+    from .pricing import ManifestError, parse_manifest, price_manifest
+    from .port_search import port_search, MAX_LIMIT as PORT_SEARCH_MAX_LIMIT
+    from .changes import (change_feed, StaleCursor, MAX_LIMIT as CHANGES_MAX_LIMIT, MAX_WAIT as CHANGES_MAX_WAIT,
+                          RETENTION_DAYS as CHANGES_RETENTION_DAYS)
+    from .validity import overlapping, parse_instant, parse_interval, utcnow, valid_at
+    from .compaction import compact_rates, DEFAULT_AGE_DAYS as COMPACT_AGE_DAYS
 except ImportError:
     from config import app, db, api
     from models import User, Port, PortPair, ContainerType, Rate, Quote, QuoteRate
-
-with app.app_context():
-    db.create_all()
-
-def current_user():
-    uid = session.get('user_id')
-    return User.query.get(uid) if uid else None
+    from rate_index import rate_index
+    from rate_import import RateImport, parse_csv, parse_ndjson
+    from serializers import to_dict, to_dicts, load_options, field_names
+    from versions import table_versions
+    from http_cache import cached_json, cached_blob
+    from passwords import password_hasher, PasswordHasherBusy
+    from metrics import metrics, password_hashing_lines, admission_lines
+    from admission import admission
+    from exports import stream_export, FORMATS as EXPORT_FORMATS
+    from pricing import ManifestError, parse_manifest, price_manifest
+    from port_search import port_search, MAX_LIMIT as PORT_SEARCH_MAX_LIMIT
+    from changes import (change_feed, StaleCursor, MAX_LIMIT as CHANGES_MAX_LIMIT, MAX_WAIT as CHANGES_MAX_WAIT,
+                         RETENTION_DAYS as CHANGES_RETENTION_DAYS)
+    from validity import overlapping, parse_instant, parse_interval, utcnow, valid_at
+    from compaction import compact_rates, DEFAULT_AGE_DAYS as COMPACT_AGE_DAYS
 
 def current_user_id():
-    u = current_user()
-    return u.id if u else None
-
-def require_owner(record_user_id):
-    user = current_user()
-    return user and user.id == record_user_id
+    # The session cookie is signed, so its user id can be trusted as is.
+    return session.get('user_id')
+
+def current_user(*options):
+    """The session's User row, loaded at most once per request."""
+    if 'current_user' not in g:
+        uid = current_user_id()
+        g.current_user = User.query.options(*options).get(uid) if uid else None
+    return g.current_user
+
+def owned_quote(qid, *options):
+    """The quote if the session user owns it, else None; 404 if it does not exist."""
+    uid = current_user_id()
+    if uid:
+        q = Quote.query.options(*options).filter_by(id=qid, user_id=uid).first()
+        if q is not None:
+            return q
+    if db.session.query(Quote.id).filter_by(id=qid).first() is None:
+        abort(404)
+    return None
+
+def hasher_busy():
+    return {"error": "server busy, try again"}, 503, {"Retry-After": str(PasswordHasherBusy.retry_after)}
 
 class Signup(Resource):
+    rate_limits = {"post": "auth"}
+
     def post(self):
         data = request.get_json()
         email = data.get('email')
@@ -38,27 +85,44 @@ class Signup(Resource):
         if User.query.filter_by(email=email).first():
             return {"error": "email already used"}, 400
         u = User(email=email)
-        u.set_password(password)
+        try:
+            u.set_password(password)
+        except PasswordHasherBusy:
+            return hasher_busy()
         db.session.add(u)
         db.session.commit()
         session['user_id'] = u.id
-        return u.to_dict(), 201
+        return to_dict(u), 201
     
 class Login(Resource):
+    rate_limits = {"post": "auth"}
+
     def post(self):
         data = request.get_json() or {}
-        u = User.query.filter_by(email=data.get('email')).first()
-        if not u or not u.check_password(data.get('password')):
-            return {"error": "invalid login"}, 401
+        password = data.get('password')
+        u = User.query.options(*load_options(User)).filter_by(email=data.get('email')).first()
+        try:
+            if not u or not u.check_password(password):
+                return {"error": "invalid login"}, 401
+        except PasswordHasherBusy:
+            return hasher_busy()
+        if password_hasher.needs_rehash(u.password_hash):
+            # Upgrade to the configured cost; skipped if the pool is saturated
+            # and retried on a later login.
+            try:
+                u.set_password(password)
+                db.session.commit()
+            except PasswordHasherBusy:
+                pass
         session['user_id'] = u.id
-        return u.to_dict(), 200
+        return to_dict(u), 200
     
 class Me(Resource):
     def get(self):
-        u = current_user()
+        u = current_user(*load_options(User))
         if not u:
             return {"error": "not logged in"}, 401
-        return u.to_dict(), 200
+        return to_dict(u), 200
     
 class Logout(Resource):
     def delete(self):
@@ -67,7 +131,10 @@ class Logout(Resource):
 
 class Ports(Resource):
     def get(self):
-        return [p.to_dict(rules=('-origin_pairs', '-dest_pairs')) for p in Port.query.all()], 200
+        return cached_json(('ports',), self._list)
+
+    def _list(self):
+        return to_dicts(Port.query.all(), rules=('-origin_pairs', '-dest_pairs')), 200
 
     def post(self):
         if not current_user_id():
@@ -82,28 +149,74 @@ class Ports(Resource):
         p = Port(name=name, code=code)
         db.session.add(p)
         db.session.commit()
-        return p.to_dict(), 201
+        return to_dict(p), 201
     
+class PortSearch(Resource):
+    def get(self):
+        q = (request.args.get("q") or "").strip()
+        if not q:
+            return {"error": "q is required"}, 400
+        try:
+            limit = int(request.args.get("limit", 10))
+        except ValueError:
+            return {"error": "limit must be an integer"}, 400
+        if not 1 <= limit <= PORT_SEARCH_MAX_LIMIT:
+            return {"error": f"limit must be between 1 and {PORT_SEARCH_MAX_LIMIT}"}, 400
+        return port_search.search(q, limit), 200
+
+def list_port_pairs(origin_code="", dest_code="", limit=None, after_id=None):
+    origin = aliased(Port)
+    dest = aliased(Port)
+
+    # Inner joins when filtering by code let SQLite start from the port
+    # code index instead of scanning every pair.
+    q = db.session.query(
+        PortPair.id,
+        origin.id, origin.name, origin.code,
+        dest.id, dest.name, dest.code,
+    )
+    q = (q.join if origin_code else q.outerjoin)(origin, PortPair.origin_port_id == origin.id)
+    q = (q.join if dest_code else q.outerjoin)(dest, PortPair.destination_port_id == dest.id)
+
+    if origin_code:
+        q = q.filter(origin.code == origin_code)
+    if dest_code:
+        q = q.filter(dest.code == dest_code)
+    if after_id is not None:
+        q = q.filter(PortPair.id > after_id)
+
+    q = q.order_by(PortPair.id.asc())
+    if limit is not None:
+        q = q.limit(limit)
+
+    result = []
+    for pp_id, o_id, o_name, o_code, d_id, d_name, d_code in q:
+        result.append({
+            "id": pp_id,
+            "origin_port": {"id": o_id, "name": o_name, "code": o_code} if o_id is not None else None,
+            "destination_port": {"id": d_id, "name": d_name, "code": d_code} if d_id is not None else None,
+            "label": f"{o_name} → {d_name}" if o_id is not None and d_id is not None else "",
+        })
+    return result
+
 class PortPairs(Resource):
     def get(self):
-        pps = PortPair.query.all()
-        result = []
-        for pp in pps:
-            result.append({
-                "id": pp.id,
-                "origin_port": {
-                    "id": pp.origin_port.id,
-                    "name": pp.origin_port.name,
-                    "code": pp.origin_port.code
-                } if pp.origin_port else None,
-                "destination_port": {
-                    "id": pp.destination_port.id,
-                    "name": pp.destination_port.name,
-                    "code": pp.destination_port.code
-                } if pp.destination_port else None,
-                "label": f"{pp.origin_port.name} → {pp.destination_port.name}" if pp.origin_port and pp.destination_port else ""
-            })
-        return result, 200
+        return cached_json(('ports', 'port_pairs'), self._list,
+                           params=("origin", "destination", "limit", "after_id"))
+
+    def _list(self):
+        origin_code = (request.args.get("origin") or "").strip().upper()
+        dest_code = (request.args.get("destination") or "").strip().upper()
+        limit = request.args.get("limit")
+        after_id = request.args.get("after_id")
+        try:
+            limit = int(limit) if limit is not None else None
+            after_id = int(after_id) if after_id is not None else None
+        except ValueError:
+            return {"error": "limit and after_id must be integers"}, 400
+        if limit is not None and limit < 1:
+            return {"error": "limit must be positive"}, 400
+        return list_port_pairs(origin_code, dest_code, limit, after_id), 200
 
     def post(self):
         if not current_user_id():
@@ -121,11 +234,14 @@ class PortPairs(Resource):
         pp = PortPair(origin_port_id=origin_id, destination_port_id=dest_id)
         db.session.add(pp)
         db.session.commit()
-        return pp.to_dict(), 201
+        return to_dict(pp), 201
 
 class ContainerTypes(Resource):
     def get(self):
-        return [t.to_dict() for t in ContainerType.query.order_by(ContainerType.code).all()], 200
+        return cached_json(('container_types',), self._list)
+
+    def _list(self):
+        return to_dicts(ContainerType.query.order_by(ContainerType.code).all()), 200
 
     def post(self):
         data = request.get_json() or {}
@@ -139,54 +255,422 @@ class ContainerTypes(Resource):
         t = ContainerType(code=code)
         db.session.add(t)
         db.session.commit()
-        return t.to_dict(), 201
+        return to_dict(t), 201
     
+def rate_filter_args():
+    """(port_pair_id, container_type_id) from the query string, or an error."""
+    ppid = request.args.get("port_pair_id")
+    ctid = request.args.get("container_type_id")
+    try:
+        ppid = int(ppid) if ppid is not None else None
+        ctid = int(ctid) if ctid is not None else None
+    except ValueError:
+        return (None, None), ({"error": "port_pair_id and container_type_id must be integers"}, 400)
+    return (ppid, ctid), None
+
+def as_of_arg(data=None):
+    """``as_of`` from the query string, or ``data`` (a JSON body), as a UTC
+    datetime; None means now. Returns ``(as_of, None)`` or ``(None, error)``."""
+    value = request.args.get("as_of")
+    if value is None and isinstance(data, dict):
+        value = data.get("as_of")
+    if value in (None, ""):
+        return None, None
+    try:
+        return parse_instant(value), None
+    except ValueError:
+        return None, ({"error": "as_of must be an ISO 8601 date or date-time"}, 400)
+
+def export_format():
+    fmt = request.args.get("format", "ndjson")
+    return fmt if fmt in EXPORT_FORMATS else None
+
+def export_format_error():
+    return {"error": f"format must be one of {sorted(EXPORT_FORMATS)}"}, 400
+
 class Rates(Resource):
     def get(self):
-        q = Rate.query
-
-        ppid = request.args.get("port_pair_id")
-        ctid = request.args.get("container_type_id")
-
-        try:
-            if ppid is not None:
-                q = q.filter(Rate.port_pair_id == int(ppid))
-            if ctid is not None:
-                q = q.filter(Rate.container_type_id == int(ctid))
-        except ValueError:
-            return {"error": "port_pair_id and container_type_id must be integers"}, 400
+        as_of, error = as_of_arg()
+        if error:
+            return error
+        # What is in force also changes as time passes rates' validity dates;
+        # the period stands in for as_of, which is the same data throughout it.
+        return cached_json(('ports', 'port_pairs', 'container_types', 'rates'),
+                           lambda: self._list(as_of), variant=rate_index.period(as_of),
+                           params=("port_pair_id", "container_type_id"))
+
+    def _list(self, as_of):
+        (ppid, ctid), error = rate_filter_args()
+        if error:
+            return error
+
+        index = rate_index.view()
+        rate_ids = index.rate_ids(port_pair_id=ppid, container_type_id=ctid, as_of=as_of)
+        # A rate dropped while the index catches up is left out.
+        rates = (index.rate_dict(rid) for rid in rate_ids)
+        return [rate for rate in rates if rate is not None], 200
 
-        rates = q.order_by(Rate.base_rate.asc()).all()
-        return [r.to_dict(rules=('port_pair','container_type')) for r in rates], 200
-    
     def post(self):
         if not current_user_id():
             return {"error": "Unauthorized"}, 401
         data = request.get_json() or {}
+        try:
+            effective_from, effective_to = parse_interval(data.get("effective_from"), data.get("effective_to"))
+            if data.get("supersede") and effective_from is None:
+                effective_from, effective_to = parse_interval(utcnow(), effective_to)
+        except ValueError:
+            return {"error": "effective_from and effective_to must be ISO 8601 dates, "
+                             "effective_to after effective_from"}, 400
         try:
             new_rate = Rate(
                 port_pair_id=int(data["port_pair_id"]),
                 container_type_id=int(data["container_type_id"]),
                 transit_days=int(data["transit_days"]),
                 base_rate=float(data["base_rate"]),
+                effective_from=effective_from,
+                effective_to=effective_to,
             )
+            if data.get("supersede"):
+                # A new tariff for the lane: rates in force when it starts end there.
+                for old in Rate.query.filter(
+                    Rate.port_pair_id == new_rate.port_pair_id,
+                    Rate.container_type_id == new_rate.container_type_id,
+                    overlapping(Rate, effective_from),
+                ):
+                    old.effective_to = effective_from
             db.session.add(new_rate)
             db.session.commit()
-            return new_rate.to_dict(rules=('port_pair','container_type')), 201
+            return to_dict(new_rate, rules=('port_pair','container_type')), 201
         except Exception:
             db.session.rollback()
             return {"error": "Invalid rate data"}, 400
     
+class Changes(Resource):
+    """Rows of ports, port pairs, container types and rates changed after ``since``.
+
+    Without ``since`` only the current cursor is returned: load the lists
+    once, then poll with it. ``wait`` (seconds) holds the request open until
+    something changes.
+    """
+    def get(self):
+        since = request.args.get("since")
+        try:
+            limit = int(request.args.get("limit", 1000))
+            wait = float(request.args.get("wait", 0))
+            since = int(since) if since is not None else None
+        except ValueError:
+            return {"error": "since, limit and wait must be numbers"}, 400
+        if not 1 <= limit <= CHANGES_MAX_LIMIT:
+            return {"error": f"limit must be between 1 and {CHANGES_MAX_LIMIT}"}, 400
+        if not 0 <= wait <= CHANGES_MAX_WAIT:
+            return {"error": f"wait must be between 0 and {CHANGES_MAX_WAIT}"}, 400
+        if since is None:
+            return {"cursor": change_feed.head(), "changes": [], "more": False}, 200
+        if since < 0:
+            return {"error": "since must not be negative"}, 400
+        try:
+            return change_feed.read(since, limit, wait), 200
+        except StaleCursor:
+            return {"error": "cursor is no longer valid, reload and start from a new cursor"}, 410
+
+# section -> (tables it is built from, builder, keys of its rows); "user"
+# is per session.
+BOOTSTRAP_SECTIONS = {
+    "container_types": (("container_types",), lambda: ContainerTypes()._list()[0],
+                        field_names(ContainerType)),
+    "port_pairs": (("ports", "port_pairs"), list_port_pairs,
+                   frozenset(("id", "origin_port", "destination_port", "label"))),
+    "ports": (("ports",), lambda: Ports()._list()[0],
+              field_names(Port, rules=('-origin_pairs', '-dest_pairs'))),
+}
+
+def select_fields(rows, fields):
+    if fields is None:
+        return rows
+    return [{k: row[k] for k in fields if k in row} for row in rows]
+
+class Bootstrap(Resource):
+    """Session user and reference data in one response.
+
+    ``include=user,ports`` picks sections (default: all) and
+    ``fields[ports]=id,code`` trims a section to the listed keys. Reference
+    sections are spliced in from cached serialized blobs.
+    """
+    def get(self):
+        include = request.args.get("include")
+        sections = sorted(set(include.split(","))) if include else sorted([*BOOTSTRAP_SECTIONS, "user"])
+        unknown = [name for name in sections if name != "user" and name not in BOOTSTRAP_SECTIONS]
+        if unknown:
+            return {"error": f"unknown sections: {', '.join(unknown)}"}, 400
+        trimmed = [arg[len("fields["):-1] for arg in request.args
+                   if arg.startswith("fields[") and arg.endswith("]")]
+        unknown = sorted(name for name in trimmed if name != "user" and name not in BOOTSTRAP_SECTIONS)
+        if unknown:
+            return {"error": f"unknown sections in fields: {', '.join(unknown)}"}, 400
+
+        render = api.representations["application/json"]
+        parts = []
+        for name in sections:
+            # Only what /auth/me already shows the user.
+            allowed = field_names(User) if name == "user" else BOOTSTRAP_SECTIONS[name][2]
+            fields = {f.strip() for f in request.args.get(f"fields[{name}]", "").split(",") if f.strip()}
+            hidden = sorted(fields - allowed)
+            if hidden:
+                return {"error": f"unknown fields[{name}]: {', '.join(hidden)}"}, 400
+            # Listing every field is the same as listing none.
+            fields = tuple(sorted(fields)) if fields and fields != allowed else None
+            if name == "user":
+                u = current_user(*load_options(User, only=fields or ()))
+                blob = render(to_dict(u, only=fields or ()) if u else None, 200).get_data()
+            else:
+                tables, build, _ = BOOTSTRAP_SECTIONS[name]
+                blob = cached_blob((name, fields), tables, lambda: select_fields(build(), fields))
+            parts.append(b'"%s":%s' % (name.encode(), blob.strip()))
+        return Response(b"{" + b",".join(parts) + b"}\n", mimetype="application/json")
+
+RATE_EXPORT_COLUMNS = [
+    "id", "port_pair_id", "origin_code", "destination_code",
+    "container_type_id", "container_code", "base_rate", "transit_days",
+    "effective_from", "effective_to",
+]
+
+class RatesExport(Resource):
+    rate_limits = {"get": "bulk"}
+
+    def get(self):
+        fmt = export_format()
+        if fmt is None:
+            return export_format_error()
+        (ppid, ctid), error = rate_filter_args()
+        if error:
+            return error
+        # Unlike /rates, the export has every rate, with its validity dates,
+        # unless as_of is given.
+        as_of, error = as_of_arg()
+        if error:
+            return error
+
+        origin, destination = aliased(Port), aliased(Port)
+        stmt = (
+            select(
+                Rate.id, Rate.port_pair_id, origin.code, destination.code,
+                Rate.container_type_id, ContainerType.code, Rate.base_rate, Rate.transit_days,
+                Rate.effective_from, Rate.effective_to,
+            )
+            .join(PortPair, PortPair.id == Rate.port_pair_id)
+            .join(origin, origin.id == PortPair.origin_port_id)
+            .join(destination, destination.id == PortPair.destination_port_id)
+            .join(ContainerType, ContainerType.id == Rate.container_type_id)
+            .order_by(Rate.id)
+        )
+        if ppid is not None:
+            stmt = stmt.where(Rate.port_pair_id == ppid)
+        if ctid is not None:
+            stmt = stmt.where(Rate.container_type_id == ctid)
+        if as_of is not None:
+            stmt = stmt.where(valid_at(as_of))
+        return stream_export(stmt, RATE_EXPORT_COLUMNS, fmt, "rates")
+
+class RateImports(Resource):
+    rate_limits = {"post": "bulk"}
+
+    def post(self):
+        if not current_user_id():
+            return {"error": "Unauthorized"}, 401
+        fmt = request.args.get("format")
+        if fmt is None:
+            fmt = "ndjson" if "json" in (request.mimetype or "") else "csv"
+        if fmt not in ("csv", "ndjson"):
+            return {"error": "format must be csv or ndjson"}, 400
+
+        supersede = request.args.get("supersede") in ("1", "true")
+
+        rows = parse_csv(request.stream) if fmt == "csv" else parse_ndjson(request.stream)
+        try:
+            result = RateImport(supersede=supersede).run(rows)
+        finally:
+            # Core inserts bypass the session hooks that bump versions.
+            table_versions.bump('port_pairs', 'rates')
+        return result.report(), 200
+
+class BestRate(Resource):
+    def get(self):
+        origin = (request.args.get("origin") or "").strip().upper()
+        destination = (request.args.get("destination") or "").strip().upper()
+        container = (request.args.get("container") or "").strip()
+        by = request.args.get("by", "price")
+        if not origin or not destination or not container:
+            return {"error": "origin, destination and container are required"}, 400
+        if by not in ("price", "transit"):
+            return {"error": "by must be price or transit"}, 400
+        as_of, error = as_of_arg()
+        if error:
+            return error
+
+        index = rate_index.view()
+        origin_id = index.port_id(origin)
+        dest_id = index.port_id(destination)
+        ctid = index.container_type_id(container)
+        if origin_id is None or dest_id is None or ctid is None:
+            return {"error": "unknown port or container code"}, 404
+
+        rid = index.best(origin_id, dest_id, ctid, by=by, as_of=as_of)
+        rate = index.rate_dict(rid) if rid is not None else None
+        if rate is None:
+            return {"error": "no rate for this lane"}, 404
+        return rate, 200
+
+class Routes(Resource):
+    def get(self):
+        origin = (request.args.get("origin") or "").strip().upper()
+        destination = (request.args.get("destination") or "").strip().upper()
+        container = (request.args.get("container") or "").strip()
+        by = request.args.get("by", "price")
+        try:
+            k = int(request.args.get("k", 3))
+            max_legs = int(request.args.get("max_legs", 3))
+        except ValueError:
+            return {"error": "k and max_legs must be integers"}, 400
+        if not origin or not destination or not container:
+            return {"error": "origin, destination and container are required"}, 400
+        if by not in ("price", "transit"):
+            return {"error": "by must be price or transit"}, 400
+        if not 1 <= k <= 10:
+            return {"error": "k must be between 1 and 10"}, 400
+        if not 1 <= max_legs <= 5:
+            return {"error": "max_legs must be between 1 and 5"}, 400
+        as_of, error = as_of_arg()
+        if error:
+            return error
+
+        index = rate_index.view()
+        origin_id = index.port_id(origin)
+        dest_id = index.port_id(destination)
+        ctid = index.container_type_id(container)
+        if origin_id is None or dest_id is None or ctid is None:
+            return {"error": "unknown port or container code"}, 404
+
+        result = []
+        for rate_ids in index.routes(origin_id, dest_id, ctid, by=by, k=k, max_legs=max_legs,
+                                     as_of=as_of):
+            legs = [index.rate_dict(rid) for rid in rate_ids]
+            if None in legs:
+                continue
+            transit = [leg["transit_days"] for leg in legs]
+            result.append({
+                "rate_ids": rate_ids,
+                "ports": [legs[0]["port_pair"]["origin_port"]["code"]]
+                         + [leg["port_pair"]["destination_port"]["code"] for leg in legs],
+                "total_rate": sum(leg["base_rate"] for leg in legs),
+                "transit_days": None if None in transit else sum(transit),
+                "legs": legs,
+            })
+        return result, 200
+
+QUOTE_SORTS = {"id": Quote.id, "title": Quote.title, "status": Quote.status}
+
+def quote_listing_args():
+    """status/sort/limit/after_id from the query string, validated.
+
+    Returns ``(args, None)``, or ``(None, error_response)``.
+    """
+    status = request.args.get("status")
+    sort = request.args.get("sort", "id")
+    limit = request.args.get("limit")
+    after_id = request.args.get("after_id")
+    try:
+        limit = int(limit) if limit is not None else None
+        after_id = int(after_id) if after_id is not None else None
+    except ValueError:
+        return None, ({"error": "limit and after_id must be integers"}, 400)
+    if limit is not None and limit < 1:
+        return None, ({"error": "limit must be positive"}, 400)
+    if sort.lstrip("-") not in QUOTE_SORTS:
+        return None, ({"error": f"sort must be one of {sorted(QUOTE_SORTS)}, optionally prefixed with -"}, 400)
+    return {"status": status, "sort": sort, "limit": limit, "after_id": after_id}, None
+
+def filter_quotes(q, uid, status=None, sort="id", limit=None, after_id=None):
+    """Restrict a query over Quote to the listing's user, filters and page."""
+    q = q.filter(Quote.user_id == uid)
+    if status:
+        q = q.filter(Quote.status == status)
+
+    # Keyset pagination on (sort column, id): rows strictly after the
+    # position of `after_id` in the requested order.
+    desc = sort.startswith("-")
+    col = QUOTE_SORTS[sort.lstrip("-")]
+    if after_id is not None:
+        if col is Quote.id:
+            q = q.filter(Quote.id < after_id if desc else Quote.id > after_id)
+        else:
+            anchor = db.session.query(col).filter(Quote.id == after_id).scalar_subquery()
+            if desc:
+                q = q.filter(or_(col < anchor, and_(col == anchor, Quote.id < after_id)))
+            else:
+                q = q.filter(or_(col > anchor, and_(col == anchor, Quote.id > after_id)))
+    q = q.order_by(*quote_order(sort))
+    if limit is not None:
+        q = q.limit(limit)
+    return q
+
+def quote_order(sort):
+    desc = sort.startswith("-")
+    col = QUOTE_SORTS[sort.lstrip("-")]
+    order = [col.desc() if desc else col.asc()]
+    if col is not Quote.id:
+        order.append(Quote.id.desc() if desc else Quote.id.asc())
+    return order
+
+def quote_lines(rate_ids, as_of=None):
+    """Line snapshots for ``rate_ids``, or None if any rate does not exist
+    or is not in force ``as_of`` (default now)."""
+    index = rate_index.view()
+    if not all(index.in_force(rid, as_of) for rid in rate_ids):
+        return None
+    lines = [index.line_snapshot(rid) for rid in sorted(rate_ids)]
+    return None if None in lines else lines
+
+RATES_NOT_FOUND = {"error": "one or more rates not found or not in force"}, 400
+
+def insert_quote_lines(quote_id, lines):
+    db.session.execute(QuoteRate.__table__.insert(), [{"quote_id": quote_id, **line} for line in lines])
+
 class Quotes(Resource):
     def get(self):
-        user = current_user()
-        if not user:
+        uid = current_user_id()
+        if not uid:
             return {"error": "Unauthorized"}, 401
-        return [q.to_dict() for q in Quote.query.filter_by(user_id=user.id).all()], 200
+
+        args, error = quote_listing_args()
+        if error:
+            return error
+        view = request.args.get("view", "full")
+        if view not in ("full", "summary"):
+            return {"error": "view must be full or summary"}, 400
+
+        if view == "summary":
+            q = db.session.query(
+                Quote.id, Quote.title, Quote.status, Quote.user_id, Quote.version,
+                Quote.line_count, Quote.total_base_rate, Quote.max_transit_days,
+            )
+        else:
+            q = Quote.query.options(*load_options(Quote))
+        q = filter_quotes(q, uid, **args)
+
+        if view == "summary":
+            return [
+                {
+                    "id": qid, "title": title, "status": st, "user_id": user_id,
+                    "version": version, "line_count": line_count, "total_base_rate": total,
+                    "max_transit_days": max_transit,
+                }
+                for qid, title, st, user_id, version, line_count, total, max_transit in q
+            ], 200
+        return to_dicts(q.all()), 200
 
     def post(self):
-        user = current_user()
-        if not user:
+        uid = current_user_id()
+        if not uid:
             return {"error": "login required"}, 401
 
         data = request.get_json() or {}
@@ -202,19 +686,20 @@ class Quotes(Resource):
             rate_ids = [int(x) for x in raw_rate_ids]
         except (TypeError, ValueError):
             return {"error": "rate_ids must be integers"}, 400
+        as_of, error = as_of_arg(data)
+        if error:
+            return error
 
-        rates = Rate.query.filter(Rate.id.in_(rate_ids)).all()
-        if len(rates) != len(set(rate_ids)):
-            return {"error": "one or more rates not found"}, 400
+        lines = quote_lines(set(rate_ids), as_of)
+        if lines is None:
+            return RATES_NOT_FOUND
 
         try:
-            q = Quote(title=title, status="Confirmed", user_id=user.id)
+            q = Quote(title=title, status="Confirmed", user_id=uid)
+            q.set_totals(lines)
             db.session.add(q)
             db.session.flush()
-
-            for r in rates:
-                db.session.add(QuoteRate(quote_id=q.id, rate_id=r.id))
-
+            insert_quote_lines(q.id, lines)
             db.session.commit()
         except Exception as e:
             db.session.rollback()
@@ -227,43 +712,167 @@ class Quotes(Resource):
             "user_id": q.user_id,
         }, 201
     
+# The first four columns identify the quote; NDJSON nests the rest as "lines".
+QUOTE_EXPORT_COLUMNS = [
+    "id", "title", "status", "version",
+    "rate_id", "origin_code", "destination_code", "container_code", "base_rate", "transit_days",
+    "quantity",
+]
+
+class QuotesExport(Resource):
+    rate_limits = {"get": "bulk"}
+
+    def get(self):
+        uid = current_user_id()
+        if not uid:
+            return {"error": "Unauthorized"}, 401
+        fmt = export_format()
+        if fmt is None:
+            return export_format_error()
+        args, error = quote_listing_args()
+        if error:
+            return error
+
+        page = filter_quotes(db.session.query(Quote.id), uid, **args).subquery()
+        stmt = (
+            select(
+                Quote.id, Quote.title, Quote.status, Quote.version,
+                QuoteRate.rate_id, QuoteRate.origin_code, QuoteRate.destination_code,
+                QuoteRate.container_code, QuoteRate.base_rate, QuoteRate.transit_days,
+                QuoteRate.quantity,
+            )
+            .join(page, page.c.id == Quote.id)
+            .outerjoin(QuoteRate, QuoteRate.quote_id == Quote.id)
+            .order_by(*quote_order(args["sort"]), QuoteRate.id)
+        )
+        return stream_export(stmt, QUOTE_EXPORT_COLUMNS, fmt, "quotes", group=(4, "lines"))
+
+class QuotePrice(Resource):
+    rate_limits = {"post": "bulk"}
+
+    def post(self):
+        data = request.get_json() or {}
+        by = data.get("by", "price")
+        if by not in ("price", "transit"):
+            return {"error": "by must be price or transit"}, 400
+        try:
+            lines = parse_manifest(data.get("lines"))
+        except ManifestError as e:
+            return {"error": str(e)}, 400
+        as_of, error = as_of_arg(data)
+        if error:
+            return error
+
+        result = price_manifest(lines, by=by, as_of=as_of)
+        if not data.get("save"):
+            return result, 200
+
+        uid = current_user_id()
+        if not uid:
+            return {"error": "login required to save a quote"}, 401
+        title = (data.get("title") or "").strip()
+        if not title:
+            return {"error": "title required"}, 400
+        if result["unpriced"]:
+            return {"error": "cannot save a quote with unpriced lines", "unpriced": result["unpriced"]}, 400
+
+        # A quote holds each rate once, with the quantities of every manifest
+        # line priced at it, so its total matches total_cost.
+        quantities = {}
+        for line in result["lines"]:
+            quantities[line["rate_id"]] = quantities.get(line["rate_id"], 0) + line["quantity"]
+        lines = quote_lines(quantities.keys(), as_of)
+        if lines is None:
+            return RATES_NOT_FOUND
+        for line in lines:
+            line["quantity"] = quantities[line["rate_id"]]
+        try:
+            q = Quote(title=title, status="Confirmed", user_id=uid)
+            q.set_totals(lines)
+            db.session.add(q)
+            db.session.flush()
+            insert_quote_lines(q.id, lines)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            return {"error": "server failed to create quote"}, 500
+        result["quote"] = {"id": q.id, "title": q.title, "status": q.status, "user_id": q.user_id}
+        return result, 201
+
 class QuoteDetail(Resource):
     def get(self, qid):
-        user = current_user()
-        if not user:
+        if not current_user_id():
             return {"error": "Unauthorized"}, 401
-        q = Quote.query.get_or_404(qid)
-        if q.user_id != user.id:
+        # One query for the quote, one for its line snapshots.
+        q = owned_quote(qid, *load_options(Quote))
+        if q is None:
             return {"error": "Forbidden"}, 403
-        return q.to_dict(rules=('rates',)), 200
+        return to_dict(q), 200
 
     def patch(self, qid):
-        q = Quote.query.get_or_404(qid)
-        if not require_owner(q.user_id):
+        q = owned_quote(qid)
+        if q is None:
             return {"error": "forbidden"}, 403
 
         data = request.get_json() or {}
+        as_of, error = as_of_arg(data)
+        if error:
+            return error
+        if 'version' in data and data['version'] != q.version:
+            return {"error": "quote was modified by someone else, reload and retry"}, 409
+
         if 'title' in data:
             q.title = data['title'] or q.title
         if 'status' in data:
             q.status = data['status']
         if 'rate_ids' in data:
-            QuoteRate.query.filter_by(quote_id=q.id).delete()
-            for rid in data['rate_ids']:
-                db.session.add(QuoteRate(quote_id=q.id, rate_id=int(rid)))
-
-        db.session.commit()
-        return q.to_dict(rules=('rates',)), 200
+            raw_rate_ids = data['rate_ids']
+            if not isinstance(raw_rate_ids, list):
+                return {"error": "rate_ids must be a list"}, 400
+            try:
+                rate_ids = {int(x) for x in raw_rate_ids}
+            except (TypeError, ValueError):
+                return {"error": "rate_ids must be integers"}, 400
+
+            existing = {
+                rid: {"base_rate": base_rate, "transit_days": transit_days, "quantity": quantity}
+                for rid, base_rate, transit_days, quantity in db.session.query(
+                    QuoteRate.rate_id, QuoteRate.base_rate, QuoteRate.transit_days, QuoteRate.quantity
+                ).filter_by(quote_id=q.id)
+            }
+            # Lines already on the quote keep the price they were quoted at.
+            added = quote_lines(rate_ids - existing.keys(), as_of)
+            if added is None:
+                return RATES_NOT_FOUND
+            removed = existing.keys() - rate_ids
+            if removed:
+                QuoteRate.query.filter(
+                    QuoteRate.quote_id == q.id, QuoteRate.rate_id.in_(removed)
+                ).delete(synchronize_session=False)
+            if added:
+                insert_quote_lines(q.id, added)
+            q.set_totals([line for rid, line in existing.items() if rid in rate_ids] + added)
+
+        q.version = q.version + 1
+        try:
+            db.session.commit()
+        except StaleDataError:
+            db.session.rollback()
+            return {"error": "quote was modified by someone else, reload and retry"}, 409
+        q = Quote.query.options(*load_options(Quote)).filter_by(id=q.id).one()
+        return to_dict(q), 200
 
     def delete(self, qid):
-        q = Quote.query.get_or_404(qid)
-        if not require_owner(q.user_id):
+        q = owned_quote(qid)
+        if q is None:
             return {"error": "forbidden"}, 403
         db.session.delete(q)
         db.session.commit()
         return {}, 204
     
 class AdminUsers(Resource):
+    rate_limits = {"post": "auth"}
+
     def post(self):
         if not current_user_id():
             return {"error": "Unauthorized"}, 401
@@ -279,27 +888,82 @@ class AdminUsers(Resource):
             return {"error": "email already used"}, 400
 
         u = User(email=email)
-        u.set_password(password)
+        try:
+            u.set_password(password)
+        except PasswordHasherBusy:
+            return hasher_busy()
         db.session.add(u)
         db.session.commit()
-        return u.to_dict(), 201
-    
+        return to_dict(u), 201
+
+class PasswordHashingStats(Resource):
+    def get(self):
+        if not current_user_id():
+            return {"error": "Unauthorized"}, 401
+        return password_hasher.stats(), 200
+
+class Metrics(Resource):
+    def get(self):
+        token = app.config['METRICS_TOKEN']
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            return {"error": "Unauthorized"}, 401
+        body = metrics.render(password_hashing_lines(password_hasher.stats()) + admission_lines(admission.stats()))
+        return Response(body, mimetype='text/plain; version=0.0.4')
+
     
 api.add_resource(Signup, '/auth/signup')
 api.add_resource(Login,  '/auth/login')
 api.add_resource(Me,     '/auth/me')
 api.add_resource(Logout, '/auth/logout')
+api.add_resource(Bootstrap, '/bootstrap')
 
 api.add_resource(Ports, '/ports')
+api.add_resource(PortSearch, '/ports/search')
 api.add_resource(PortPairs, '/port_pairs')
 api.add_resource(ContainerTypes, '/container_types')
 api.add_resource(Rates, '/rates')
+api.add_resource(RateImports, '/rates/import')
+api.add_resource(RatesExport, '/rates/export')
+api.add_resource(BestRate, '/rates/best')
+api.add_resource(Routes, '/routes')
+api.add_resource(Changes, '/changes')
 
 api.add_resource(Quotes, '/quotes')
+api.add_resource(QuotesExport, '/quotes/export')
+api.add_resource(QuotePrice, '/quotes/price')
 api.add_resource(QuoteDetail, '/quotes/<int:qid>')
 api.add_resource(AdminUsers, '/admin/users')
+api.add_resource(PasswordHashingStats, '/admin/password_hashing')
+api.add_resource(Metrics, '/metrics')
+
+
+@app.cli.command('init-db')
+def init_db():
+    """Create any missing tables without migrations (development, tests)."""
+    db.create_all()
+    print("tables created")
+
+
+@app.cli.command('compact-rates')
+@click.option('--older-than-days', type=int, default=COMPACT_AGE_DAYS,
+              help='archive rates that expired at least this many days ago')
+def compact_rates_command(older_than_days):
+    """Move expired rates to rates_archive."""
+    before = utcnow() - timedelta(days=older_than_days)
+    print(f"{compact_rates(before)} rates archived")
+
+
+@app.cli.command('prune-changes')
+@click.option('--older-than-days', type=int, default=CHANGES_RETENTION_DAYS,
+              help='delete change_log entries logged at least this many days ago')
+def prune_changes_command(older_than_days):
+    """Delete old change_log entries; clients with older cursors get 410."""
+    before = utcnow() - timedelta(days=older_than_days)
+    print(f"{change_feed.prune(before)} change log entries pruned")
 
 
 if __name__ == '__main__':
+    with app.app_context():
+        db.create_all()
     app.run(port=5555, debug=True)
 
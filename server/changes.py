@@ -0,0 +1,238 @@
+"""Change feed for rates and reference data.
+
+Every ORM flush that inserts, updates or deletes a port, port pair,
+container type or rate appends ``(table, row id, op)`` entries to
+``change_log`` on the same connection, so they commit or roll back with
+the write itself. Bulk Core writes log their rows with ``log_inserted()``
+or ``log_matching()``.
+
+``ChangeFeed.read(since)`` returns the entries after a cursor, one per
+changed row with its current column values, so a client that keeps its
+cursor pays for what changed rather than for the size of the tables.
+Waiting for new entries polls the shared table versions, which costs no
+database queries while nothing changes.
+
+Entries are kept for ``RETENTION_DAYS``; run ``prune()`` from cron to drop
+older ones:
+
+    flask --app server.app prune-changes --older-than-days 7
+"""
+import time
+from datetime import datetime
+
+from sqlalchemy import delete, event, func, insert, literal, select
+
+try:
+    from .config import db
+    from .models import ChangeLog, ContainerType, Port, PortPair, Rate
+    from .validity import format_instant, utcnow
+    from .versions import table_versions
+except ImportError:
+    from config import db
+    from models import ChangeLog, ContainerType, Port, PortPair, Rate
+    from validity import format_instant, utcnow
+    from versions import table_versions
+
+# table -> columns sent for its rows
+SYNCED = {
+    'ports': (Port.id, Port.name, Port.code),
+    'port_pairs': (PortPair.id, PortPair.origin_port_id, PortPair.destination_port_id),
+    'container_types': (ContainerType.id, ContainerType.code, ContainerType.description),
+    'rates': (Rate.id, Rate.port_pair_id, Rate.container_type_id, Rate.base_rate, Rate.transit_days,
+              Rate.effective_from, Rate.effective_to),
+}
+MAX_LIMIT = 5000
+# Well below gunicorn's worker timeout (30 s by default), so a long poll
+# always answers before the arbiter would give up on it.
+MAX_WAIT = 20
+POLL_INTERVAL = 0.1
+RETENTION_DAYS = 7
+PRUNE_BATCH_SIZE = 5000
+# Any constant works; it only has to be the same in every process.
+_PG_LOCK_KEY = 0x6368616e6765
+
+
+class StaleCursor(Exception):
+    """The cursor is past the end of the log, which was recreated since, or
+    before its start, which was pruned since."""
+
+
+def _serialize_writers(connection):
+    # Postgres hands out ids when rows are inserted, not when they commit, so
+    # a reader could pass an id whose transaction has not committed yet. A
+    # transaction-scoped lock makes change_log writers commit in id order.
+    # SQLite already allows one writer at a time.
+    if connection.dialect.name == 'postgresql':
+        connection.exec_driver_sql('SELECT pg_advisory_xact_lock(%d)' % _PG_LOCK_KEY)
+
+
+def log_inserted(connection, table, after_id):
+    """Log every row of ``table`` with an id above ``after_id`` as inserted.
+
+    For bulk Core inserts, which bypass the session events: read the table's
+    max id before inserting, then call this in the same transaction.
+    """
+    log_matching(connection, table, 'insert', SYNCED[table][0] > after_id)
+
+
+def log_matching(connection, table, op, where, params=None):
+    """Log every row of ``table`` matching ``where`` with ``op``.
+
+    For bulk Core updates and deletes: call it before the statement, with
+    the same condition. ``params``, a list, runs it once per parameter set.
+    """
+    _serialize_writers(connection)
+    model_id = SYNCED[table][0]
+    connection.execute(
+        insert(ChangeLog).from_select(
+            ['table_name', 'row_id', 'op'],
+            select(literal(table), model_id, literal(op))
+            .where(where)
+            .order_by(model_id),
+        ),
+        params,
+    )
+
+
+def max_id(table):
+    return db.session.query(func.coalesce(func.max(SYNCED[table][0]), 0)).scalar()
+
+
+class ChangeFeed:
+    def install(self, session):
+        event.listen(session, 'after_flush', self._log)
+
+    def _log(self, session, flush_context):
+        entries = []
+        for objs, op in ((session.new, 'insert'), (session.dirty, 'update'), (session.deleted, 'delete')):
+            for obj in objs:
+                table = getattr(obj, '__tablename__', None)
+                if table not in SYNCED:
+                    continue
+                if op == 'update' and not session.is_modified(obj, include_collections=False):
+                    continue
+                entries.append({"table_name": table, "row_id": obj.id, "op": op})
+        if entries:
+            connection = session.connection()
+            _serialize_writers(connection)
+            connection.execute(insert(ChangeLog), entries)
+
+    def head(self):
+        return db.session.query(func.coalesce(func.max(ChangeLog.id), 0)).scalar()
+
+    def read(self, since, limit=1000, wait=0):
+        """``{cursor, changes, more}`` for up to ``limit`` entries after ``since``.
+
+        With ``wait``, block up to that many seconds for a first entry.
+        Raises StaleCursor if ``since`` is beyond the newest entry.
+        """
+        entries = self.entries(since, limit)
+        if not entries and wait > 0:
+            tables = tuple(SYNCED)
+            deadline = time.monotonic() + wait
+            seen = table_versions.snapshot(tables)
+            while not entries and time.monotonic() < deadline:
+                # Hand the connection back to the pool while waiting; the
+                # next query starts a transaction that sees newer commits.
+                db.session.rollback()
+                time.sleep(POLL_INTERVAL)
+                current = table_versions.snapshot(tables)
+                if current != seen:
+                    seen = current
+                    entries = self.entries(since, limit)
+
+        cursor = entries[-1][0] if entries else since
+        return {
+            "cursor": cursor,
+            "changes": [
+                {"id": cid, "table": table, "op": op, "row_id": row_id,
+                 "row": None if row is None else _row_dict(table, row)}
+                for cid, table, op, row_id, row in self.changed_rows(entries)
+            ],
+            "more": len(entries) == limit,
+        }
+
+    def entries(self, since, limit):
+        """``(id, table, row id, op)`` entries after ``since``, oldest first.
+
+        Raises StaleCursor if ``since`` is beyond the newest entry, or before
+        the oldest one kept.
+        """
+        entries = db.session.execute(
+            select(ChangeLog.id, ChangeLog.table_name, ChangeLog.row_id, ChangeLog.op)
+            .where(ChangeLog.id > since)
+            .order_by(ChangeLog.id)
+            .limit(limit)
+        ).all()
+        if not entries and since > self.head():
+            raise StaleCursor(since)
+        # A gap right after the cursor is usually ids lost to rolled back
+        # writes; it is pruned entries only if nothing older is left.
+        if entries and entries[0][0] > since + 1 and since + 1 < self._oldest():
+            raise StaleCursor(since)
+        return entries
+
+    def _oldest(self):
+        return db.session.query(func.min(ChangeLog.id)).scalar()
+
+    def prune(self, before, batch_size=PRUNE_BATCH_SIZE):
+        """Delete entries logged before ``before``; returns how many.
+
+        The newest entry is always kept, so the head, and with it every
+        client's cursor, stays valid.
+        """
+        head = self.head()
+        pruned = 0
+        while True:
+            ids = db.session.execute(
+                select(ChangeLog.id)
+                .where(ChangeLog.changed_at < before, ChangeLog.id < head)
+                .order_by(ChangeLog.id)
+                .limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                return pruned
+            db.session.execute(delete(ChangeLog).where(ChangeLog.id.between(ids[0], ids[-1])))
+            db.session.commit()
+            pruned += len(ids)
+
+    def changed_rows(self, entries):
+        """``(id, table, op, row id, row)`` per changed row of ``entries``.
+
+        A row changed several times is given once, at the position of its
+        last change, with its current column values (a tuple of ``SYNCED``
+        columns), or None if it is deleted.
+        """
+        last = {}
+        for cid, table, row_id, op in entries:
+            last[(table, row_id)] = (cid, op)
+
+        wanted = {}
+        for (table, row_id), (_, op) in last.items():
+            if op != 'delete':
+                wanted.setdefault(table, []).append(row_id)
+        current = {}
+        for table, ids in wanted.items():
+            columns = SYNCED[table]
+            for row in db.session.execute(select(*columns).where(columns[0].in_(ids))):
+                current[(table, row[0])] = tuple(row)
+
+        changes = []
+        for (table, row_id), (cid, op) in sorted(last.items(), key=lambda item: item[1][0]):
+            row = current.get((table, row_id))
+            if row is None and op != 'delete':
+                # Deleted by a later entry these entries do not reach.
+                op = 'delete'
+            changes.append((cid, table, op, row_id, row))
+        return changes
+
+
+def _row_dict(table, row):
+    return {
+        c.key: format_instant(v) if isinstance(v, datetime) else v
+        for c, v in zip(SYNCED[table], row)
+    }
+
+
+change_feed = ChangeFeed()
+change_feed.install(db.session)
@@ -0,0 +1,67 @@
+"""Archiving of expired rates.
+
+Rates whose ``effective_to`` is at or before a cutoff are moved, ids
+unchanged, to ``rates_archive`` in batches of one transaction each, so the
+hot table and every worker's rate index only carry history that is still
+being asked about. Rates that a quote line still references stay: quote
+lines keep a foreign key to their rate. Each archived rate is logged as a
+delete for /changes clients.
+
+    flask --app server.app compact-rates --older-than-days 90
+"""
+from sqlalchemy import and_, exists, insert, select
+
+try:
+    from .changes import log_matching
+    from .config import db
+    from .models import ArchivedRate, QuoteRate, Rate
+    from .validity import utcnow
+    from .versions import table_versions
+except ImportError:
+    from changes import log_matching
+    from config import db
+    from models import ArchivedRate, QuoteRate, Rate
+    from validity import utcnow
+    from versions import table_versions
+
+BATCH_SIZE = 5000
+DEFAULT_AGE_DAYS = 90
+ARCHIVED_COLUMNS = (
+    'id', 'port_pair_id', 'container_type_id', 'base_rate', 'transit_days',
+    'effective_from', 'effective_to',
+)
+
+
+def compact_rates(before, batch_size=BATCH_SIZE):
+    """Archive rates that expired at or before ``before`` (at the latest,
+    now); returns how many."""
+    before = min(before, utcnow())
+    rates = Rate.__table__
+    archived = 0
+    after = 0
+    expired = and_(
+        rates.c.effective_to <= before,
+        ~exists().where(QuoteRate.rate_id == rates.c.id),
+    )
+    while True:
+        ids = db.session.execute(
+            select(rates.c.id)
+            .where(expired, rates.c.id > after)
+            .order_by(rates.c.id)
+            .limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            return archived
+        # The batch is every expired rate in its id range.
+        chosen = and_(expired, rates.c.id.between(ids[0], ids[-1]))
+        db.session.execute(insert(ArchivedRate.__table__).from_select(
+            ARCHIVED_COLUMNS,
+            select(*(rates.c[name] for name in ARCHIVED_COLUMNS)).where(chosen),
+        ))
+        log_matching(db.session.connection(), 'rates', 'delete', chosen)
+        db.session.execute(rates.delete().where(chosen))
+        db.session.commit()
+        # Core deletes bypass the session hooks that bump versions.
+        table_versions.bump('rates')
+        archived += len(ids)
+        after = ids[-1]
@@ -2,12 +2,15 @@
 
 # Remote library imports
 import os
+import sqlite3
 from flask import Flask
 from flask_cors import CORS
 from flask_migrate import Migrate
 from flask_restful import Api
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import MetaData
+from werkzeug.middleware.proxy_fix import ProxyFix
+from sqlalchemy import MetaData, event
+from sqlalchemy.engine import Engine
 
 # Local imports
 
@@ -16,13 +19,83 @@ app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///app.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret')
-app.json.compact = False
+app.config['TABLE_VERSIONS_PATH'] = os.getenv('TABLE_VERSIONS_PATH')
+app.config['BCRYPT_LOG_ROUNDS'] = int(os.getenv('BCRYPT_LOG_ROUNDS', 12))
+app.config['PASSWORD_HASH_WORKERS'] = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+app.config['PASSWORD_HASH_QUEUE'] = int(os.getenv('PASSWORD_HASH_QUEUE', 16))
+app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN')
+app.config['N_PLUS_ONE_THRESHOLD'] = int(os.getenv('N_PLUS_ONE_THRESHOLD', 10))
+app.config['PROFILING_ENABLED'] = os.getenv('PROFILING_ENABLED', '0') == '1'
+app.config['WARMUP'] = os.getenv('WARMUP', '1') == '1'
+app.config['WARMUP_CONNECTIONS'] = int(os.getenv('WARMUP_CONNECTIONS', 1))
+app.config['RATE_LIMIT_PATH'] = os.getenv('RATE_LIMIT_PATH')
+app.config['RATE_LIMITS_ENABLED'] = os.getenv('RATE_LIMITS_ENABLED', '1') == '1'
+# Per user (or per IP when anonymous), as "<requests>/<seconds>": the bucket
+# holds that many requests and refills at that rate.
+app.config['RATE_LIMITS'] = {
+    'auth': os.getenv('RATE_LIMIT_AUTH', '10/60'),
+    'read': os.getenv('RATE_LIMIT_READ', '600/60'),
+    'write': os.getenv('RATE_LIMIT_WRITE', '120/60'),
+    'bulk': os.getenv('RATE_LIMIT_BULK', '10/60'),
+}
+# Requests in flight per worker (0 disables the cap); writes are refused
+# from SHED_WRITES_AT of it so reads keep being served.
+app.config['MAX_IN_FLIGHT'] = int(os.getenv('MAX_IN_FLIGHT', 32))
+app.config['SHED_WRITES_AT'] = float(os.getenv('SHED_WRITES_AT', 0.75))
+# Reverse proxies in front of the app. Anonymous clients are rate limited
+# by address, so behind a proxy take it from that many X-Forwarded-For hops.
+app.config['TRUSTED_PROXIES'] = int(os.getenv('TRUSTED_PROXIES', 0))
+if app.config['TRUSTED_PROXIES']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'])
+# Smaller bodies are sent as is: compressing them saves less than it costs.
+app.config['COMPRESS_MIN_SIZE'] = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+app.json.compact = True
+# Per-process cap on cached response bodies, compressed copies included.
+app.config['HTTP_CACHE_MAX_BYTES'] = int(os.getenv('HTTP_CACHE_MAX_BYTES', 64 * 1024 * 1024))
 
 app.config['SESSION_COOKIE_SAMESITE'] = 'None'
 app.config['SESSION_COOKIE_SECURE'] = True
 
 db_url = os.getenv('DATABASE_URL', 'sqlite:///app.db')
 
+# Database performance profile
+# Pool settings apply to server databases (Postgres etc.); SQLite gets
+# per-connection pragmas instead. Set SQLITE_PRAGMAS=0 to connect with the
+# SQLite defaults.
+if db_url.startswith('sqlite'):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {}
+else:
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', '1') == '1',
+    }
+
+SQLITE_PRAGMAS = [
+    # busy_timeout first: switching to WAL needs a lock another worker may hold.
+    ('busy_timeout', int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))),
+    ('journal_mode', os.getenv('SQLITE_JOURNAL_MODE', 'WAL')),
+    ('synchronous', os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')),
+    ('mmap_size', int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))),
+    # Negative values are KiB: 64 MiB of page cache per connection.
+    ('cache_size', int(os.getenv('SQLITE_CACHE_SIZE', -64 * 1024))),
+    ('temp_store', os.getenv('SQLITE_TEMP_STORE', 'MEMORY')),
+]
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas=SQLITE_PRAGMAS):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas:
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+if os.getenv('SQLITE_PRAGMAS', '1') == '1':
+    @event.listens_for(Engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        if isinstance(dbapi_connection, sqlite3.Connection):
+            apply_sqlite_pragmas(dbapi_connection)
+
 # Define metadata, instantiate db
 metadata = MetaData(naming_convention={
     "fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s",
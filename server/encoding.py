@@ -0,0 +1,122 @@
+"""Response encoding: compact JSON bodies and negotiated compression.
+
+JSON is written without whitespace (indented only in debug mode), with
+orjson when it is installed. Responses of a compressible type that reach
+``COMPRESS_MIN_SIZE`` bytes are compressed with brotli (if the ``brotli``
+package is installed) or gzip, whichever the client's Accept-Encoding
+prefers; streamed exports are compressed chunk by chunk. Responses that
+already carry a Content-Encoding, such as the precompressed reference-data
+cache, are left alone.
+"""
+import gzip
+import json
+import zlib
+
+from flask import make_response, request
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from .config import app, api
+except ImportError:
+    from config import app, api
+
+COMPRESSIBLE = {'application/json', 'application/x-ndjson', 'text/csv', 'text/plain'}
+# Per-request levels favour speed. Cached bodies are compressed once per
+# table version and served many times, so they get more effort, but not
+# brotli's slowest levels, which take seconds on a full rate list.
+GZIP_LEVEL = 6
+GZIP_CACHE_LEVEL = 9
+BROTLI_QUALITY = 4
+BROTLI_CACHE_QUALITY = 9
+
+
+def dumps(data, pretty=None):
+    """``data`` as UTF-8 JSON bytes with a trailing newline, indented if
+    ``pretty`` (default: in debug mode)."""
+    if pretty is None:
+        pretty = app.debug
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+        try:
+            return orjson.dumps(data, option=option) + b'\n'
+        except TypeError:
+            # orjson.JSONEncodeError, e.g. integers wider than 64 bits;
+            # the json module handles those.
+            pass
+    if pretty:
+        text = json.dumps(data, indent=2)
+    else:
+        text = json.dumps(data, separators=(',', ':'))
+    return (text + '\n').encode('utf-8')
+
+
+@api.representation('application/json')
+def output_json(data, code, headers=None):
+    resp = make_response(dumps(data), code)
+    resp.mimetype = 'application/json'
+    resp.headers.extend(headers or {})
+    return resp
+
+
+def negotiate():
+    """``'br'``, ``'gzip'`` or None, by the client's Accept-Encoding."""
+    offered = ('br', 'gzip') if brotli is not None else ('gzip',)
+    return request.accept_encodings.best_match(offered)
+
+
+def compress(body, encoding, cached=False):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_CACHE_QUALITY if cached else BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_CACHE_LEVEL if cached else GZIP_LEVEL, mtime=0)
+
+
+def _compress_stream(chunks, encoding):
+    # Flush after every chunk so the client keeps receiving rows as they
+    # are produced instead of waiting for a full compression block.
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            yield compressor.process(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+            yield compressor.flush()
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            yield compressor.compress(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+            yield compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+
+
+@app.after_request
+def compress_response(response):
+    if (
+        response.mimetype not in COMPRESSIBLE
+        or response.status_code < 200 or response.status_code in (204, 304)
+        or request.method == 'HEAD'
+        or 'Content-Encoding' in response.headers
+    ):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate()
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        body = response.get_data()
+        if len(body) < app.config['COMPRESS_MIN_SIZE']:
+            return response
+        response.set_data(compress(body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,37 @@
+"""gunicorn settings for the API.
+
+    gunicorn -c server/gunicorn.conf.py server.wsgi:app
+
+Every setting can be overridden on the command line or with the environment
+variables below.
+"""
+import multiprocessing
+import os
+import time
+
+bind = os.getenv('BIND', '0.0.0.0:5555')
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# Threaded workers: a /changes long poll holds a thread, not the whole
+# worker, and the worker keeps answering the arbiter's timeout meanwhile.
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+# Import and warm the app once in the master; workers share it copy-on-write.
+preload_app = True
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 0))
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+
+_started = time.perf_counter()
+
+
+def when_ready(server):
+    server.log.info("master ready in %.2fs (app preloaded)", time.perf_counter() - _started)
+
+
+def post_fork(server, worker):
+    from server.wsgi import worker_init
+    worker_init()
+    server.log.info("worker %s ready in %.2fs after master start", worker.pid, time.perf_counter() - _started)
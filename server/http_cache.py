@@ -0,0 +1,152 @@
+"""ETag caching for reference-data GET endpoints.
+
+A response is cached per request path and the query parameters its
+endpoint reads (in a fixed order, so neither their order nor unrelated
+parameters make new entries), together with the versions of the tables it
+was built from. The ETag is derived from
+those versions, so a matching ``If-None-Match`` is answered with 304 from
+shared memory alone, and a changed table simply yields a new ETag.
+Bodies are compressed at most once per encoding and table version, so hot
+reads send stored bytes. ``cached_blob`` caches serialized parts the same
+way, for responses that are put together from several of them. The least
+recently used entries are dropped beyond ``MAX_ENTRIES`` or
+``HTTP_CACHE_MAX_BYTES`` of bodies.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import Response, request
+
+try:
+    from .config import app, api
+    from .encoding import compress, negotiate
+    from .versions import table_versions
+except ImportError:
+    from config import app, api
+    from encoding import compress, negotiate
+    from versions import table_versions
+
+MAX_ENTRIES = 256
+
+_lock = threading.Lock()
+_entries = OrderedDict()
+_size = 0
+
+
+class _Entry:
+    __slots__ = ('etag', 'body', 'encoded', 'size')
+
+    def __init__(self, etag, body):
+        self.etag = etag
+        self.body = body
+        # Content-Encoding -> compressed body
+        self.encoded = {}
+        self.size = len(body)
+
+
+def cached_json(tables, build, variant=None, params=()):
+    """Serve ``build()`` (a ``(data, status)`` pair) with ETag revalidation.
+
+    ``params`` names the query parameters ``build`` reads and ``variant`` is
+    anything else the data depends on, such as the time period of rates in
+    force. Only 200 responses are cached; anything else is returned as built.
+    """
+    args = tuple((name, request.args[name]) for name in params if name in request.args)
+    key = (request.path, args, variant)
+    versions = '.'.join(str(v) for v in table_versions.snapshot(tables))
+    if variant is not None:
+        versions += f'-{variant}'
+    digest = hashlib.sha1(repr(key[:2]).encode('utf-8')).hexdigest()[:12]
+    etag = f'{table_versions.epoch}-{versions}-{digest}'
+
+    if request.if_none_match.contains(etag):
+        _lookup(key)
+        return _response(Response(status=304), etag)
+
+    entry = _lookup(key)
+    if entry is None or entry.etag != etag:
+        data, status = build()
+        if status != 200:
+            return data, status
+        body = api.representations['application/json'](data, 200).get_data()
+        entry = _store(key, _Entry(etag, body))
+
+    encoding = negotiate() if len(entry.body) >= app.config['COMPRESS_MIN_SIZE'] else None
+    if encoding is not None:
+        body = entry.encoded.get(encoding)
+        if body is None:
+            body = entry.encoded[encoding] = compress(entry.body, encoding, cached=True)
+            _grow(key, entry, len(body))
+        resp = Response(body, 200, mimetype='application/json')
+        resp.headers['Content-Encoding'] = encoding
+    else:
+        resp = Response(entry.body, 200, mimetype='application/json')
+    return _response(resp, etag)
+
+
+def cached_blob(name, tables, build):
+    """Serialized JSON of ``build()``'s data, rebuilt when ``tables`` change.
+
+    For responses assembled from several cached parts; ``name`` must
+    identify the data, including any field selection applied to it.
+    """
+    key = ('blob', name)
+    versions = '.'.join(str(v) for v in table_versions.snapshot(tables))
+    etag = f'{table_versions.epoch}-{versions}'
+    entry = _lookup(key)
+    if entry is None or entry.etag != etag:
+        entry = _store(key, _Entry(etag, api.representations['application/json'](build(), 200).get_data()))
+    return entry.body
+
+
+def _lookup(key):
+    """The entry under ``key``, if any, marked most recently used."""
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None:
+            _entries.move_to_end(key)
+    return entry
+
+
+def _store(key, entry):
+    """Cache ``entry`` under ``key`` unless it alone is over the byte cap."""
+    global _size
+    with _lock:
+        old = _entries.pop(key, None)
+        if old is not None:
+            _size -= old.size
+        if entry.size <= app.config['HTTP_CACHE_MAX_BYTES']:
+            _entries[key] = entry
+            _size += entry.size
+            _evict()
+    return entry
+
+
+def _grow(key, entry, n):
+    """Count ``n`` more bytes (a compressed copy) against ``entry``."""
+    global _size
+    with _lock:
+        entry.size += n
+        if _entries.get(key) is entry:
+            _size += n
+            if entry.size > app.config['HTTP_CACHE_MAX_BYTES']:
+                del _entries[key]
+                _size -= entry.size
+            _evict()
+
+
+def _evict():
+    # Called with _lock held.
+    global _size
+    limit = app.config['HTTP_CACHE_MAX_BYTES']
+    while len(_entries) > MAX_ENTRIES or _size > limit:
+        _, old = _entries.popitem(last=False)
+        _size -= old.size
+
+
+def _response(resp, etag):
+    resp.set_etag(etag)
+    resp.headers['Vary'] = 'Accept-Encoding'
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp
@@ -0,0 +1,244 @@
+"""Per-endpoint request and SQL metrics.
+
+Every request is timed and labelled with its URL rule, and engine events
+count the SQL statements it runs and the time spent in them. A request that
+runs the same statement shape more than ``N_PLUS_ONE_THRESHOLD`` times is
+logged and counted as a likely N+1. ``render()`` returns it all in the
+Prometheus text format.
+
+Counters are per process: under several workers, scrape each one or put a
+Prometheus aggregation in front.
+
+With ``PROFILING_ENABLED``, a request sent with ``X-Profile: timing`` gets a
+``Server-Timing`` header, and ``X-Profile: cprofile`` replaces the response
+body with cProfile output for that request.
+"""
+import cProfile
+import io
+import pstats
+import re
+import threading
+import time
+from collections import Counter
+
+from flask import Response, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+try:
+    from .config import app
+except ImportError:
+    from config import app
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+PROFILE_LINES = 40
+
+_IN_LIST = re.compile(r'\bIN \((?:\s*(?:\?|%\(\w+\)s)\s*,)*\s*(?:\?|%\(\w+\)s)\s*\)', re.IGNORECASE)
+_local = threading.local()
+
+
+class RequestStats:
+    __slots__ = ('started', 'statements', 'sql_seconds', 'shapes', 'profiler')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.shapes = Counter()
+        self.profiler = None
+
+
+class _Histogram:
+    __slots__ = ('count', 'sum', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                self.buckets[i] += 1
+                break
+
+
+class Metrics:
+    def __init__(self, n_plus_one_threshold=10):
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self._lock = threading.Lock()
+        self._requests = Counter()      # (endpoint, method, status) -> count
+        self._latency = {}              # (endpoint, method) -> _Histogram
+        self._statements = Counter()    # endpoint -> statements
+        self._sql_seconds = Counter()   # endpoint -> seconds
+        self._n_plus_one = Counter()    # endpoint -> requests flagged
+
+    def record(self, endpoint, method, status, elapsed, stats):
+        repeated = [(shape, n) for shape, n in stats.shapes.items() if n > self.n_plus_one_threshold]
+        with self._lock:
+            self._requests[endpoint, method, status] += 1
+            hist = self._latency.get((endpoint, method))
+            if hist is None:
+                hist = self._latency[endpoint, method] = _Histogram()
+            hist.observe(elapsed)
+            self._statements[endpoint] += stats.statements
+            self._sql_seconds[endpoint] += stats.sql_seconds
+            if repeated:
+                self._n_plus_one[endpoint] += 1
+        for shape, n in repeated:
+            app.logger.warning("possible N+1 on %s %s: %d x %s", method, endpoint, n, shape)
+        return repeated
+
+    def render(self, extra=()):
+        lines = []
+        with self._lock:
+            lines += _header('http_requests_total', 'counter', 'Requests served.')
+            for (endpoint, method, status), n in sorted(self._requests.items()):
+                lines.append(f'http_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {n}')
+
+            lines += _header('http_request_duration_seconds', 'histogram', 'Request latency.')
+            for (endpoint, method), hist in sorted(self._latency.items()):
+                lines += _histogram('http_request_duration_seconds', hist.count, hist.sum, hist.buckets,
+                                    endpoint=endpoint, method=method)
+
+            lines += _header('db_statements_total', 'counter', 'SQL statements run while serving requests.')
+            for endpoint, n in sorted(self._statements.items()):
+                lines.append(f'db_statements_total{_labels(endpoint=endpoint)} {n}')
+
+            lines += _header('db_statement_seconds_total', 'counter', 'Time spent in SQL while serving requests.')
+            for endpoint, s in sorted(self._sql_seconds.items()):
+                lines.append(f'db_statement_seconds_total{_labels(endpoint=endpoint)} {s:.6f}')
+
+            lines += _header('db_n_plus_one_requests_total', 'counter',
+                             'Requests that repeated one statement shape more than the threshold.')
+            for endpoint, n in sorted(self._n_plus_one.items()):
+                lines.append(f'db_n_plus_one_requests_total{_labels(endpoint=endpoint)} {n}')
+        lines += extra
+        return '\n'.join(lines) + '\n'
+
+
+def password_hashing_lines(stats):
+    """Prometheus lines for ``PasswordHasher.stats()``."""
+    lines = []
+    for name, key, kind in (('password_hash_running', 'running', 'gauge'),
+                            ('password_hash_queued', 'queued', 'gauge'),
+                            ('password_hash_rejected_total', 'rejected', 'counter')):
+        lines += _header(name, kind, f'Password hashing pool: {key}.')
+        lines.append(f'{name} {stats[key]}')
+    lines += _header('password_hash_duration_seconds', 'histogram', 'bcrypt latency.')
+    bounds = stats['latency_buckets']
+    for op, s in sorted(stats['latency'].items()):
+        lines += _histogram('password_hash_duration_seconds', s['count'], s['sum'], s['buckets'],
+                            bounds=bounds, op=op)
+    return lines
+
+
+def admission_lines(stats):
+    """Prometheus lines for ``Admission.stats()``."""
+    lines = _header('admission_in_flight', 'gauge', 'Requests running in this worker.')
+    lines.append(f"admission_in_flight {stats['in_flight']}")
+    lines += _header('admission_shed_total', 'counter', 'Requests refused with 503 over the in-flight cap.')
+    lines.append(f"admission_shed_total {stats['shed']}")
+    lines += _header('admission_rate_limited_total', 'counter', 'Requests refused with 429, by budget class.')
+    for budget, n in sorted(stats['rate_limited'].items()):
+        lines.append(f'admission_rate_limited_total{_labels(budget=budget)} {n}')
+    return lines
+
+
+def _header(name, kind, help_text):
+    return [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+
+
+def _labels(**labels):
+    body = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                    for k, v in labels.items())
+    return '{' + body + '}'
+
+
+def _histogram(name, count, total, buckets, bounds=LATENCY_BUCKETS, **labels):
+    lines = []
+    cumulative = 0
+    for bound, n in zip(bounds, buckets):
+        cumulative += n
+        lines.append(f'{name}_bucket{_labels(**labels, le=bound)} {cumulative}')
+    lines.append(f'{name}_bucket{_labels(**labels, le="+Inf")} {count}')
+    lines.append(f'{name}_sum{_labels(**labels)} {total:.6f}')
+    lines.append(f'{name}_count{_labels(**labels)} {count}')
+    return lines
+
+
+def statement_shape(statement):
+    """Collapse expanded IN lists so batches of different sizes match."""
+    return _IN_LIST.sub('IN (?)', ' '.join(statement.split()))
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if getattr(_local, 'stats', None) is not None:
+        context._metrics_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = getattr(_local, 'stats', None)
+    started = getattr(context, '_metrics_started', None)
+    if stats is None or started is None:
+        return
+    stats.statements += 1
+    stats.sql_seconds += time.perf_counter() - started
+    stats.shapes[statement] += 1
+
+
+@app.before_request
+def _start_request():
+    stats = _local.stats = RequestStats()
+    if app.config['PROFILING_ENABLED'] and request.headers.get('X-Profile') == 'cprofile':
+        stats.profiler = cProfile.Profile()
+        stats.profiler.enable()
+
+
+@app.after_request
+def _finish_request(response):
+    stats = getattr(_local, 'stats', None)
+    if stats is None:
+        return response
+    _local.stats = None
+    if stats.profiler is not None:
+        stats.profiler.disable()
+    elapsed = time.perf_counter() - stats.started
+
+    # Raw statements differ only in IN-list length; fold them before checking.
+    shapes = Counter()
+    for statement, n in stats.shapes.items():
+        shapes[statement_shape(statement)] += n
+    stats.shapes = shapes
+
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    repeated = metrics.record(endpoint, request.method, response.status_code, elapsed, stats)
+
+    mode = request.headers.get('X-Profile') if app.config['PROFILING_ENABLED'] else None
+    if mode == 'timing':
+        response.headers['Server-Timing'] = (
+            f'app;dur={(elapsed - stats.sql_seconds) * 1000:.2f}, '
+            f'db;dur={stats.sql_seconds * 1000:.2f};desc="{stats.statements} statements"'
+        )
+        if repeated:
+            response.headers['X-N-Plus-One'] = str(len(repeated))
+    elif mode == 'cprofile' and stats.profiler is not None:
+        out = io.StringIO()
+        out.write(f'{request.method} {request.full_path} -> {response.status_code} '
+                  f'in {elapsed * 1000:.2f} ms, {stats.statements} statements '
+                  f'({stats.sql_seconds * 1000:.2f} ms)\n')
+        for shape, n in repeated:
+            out.write(f'possible N+1: {n} x {shape}\n')
+        out.write('\n')
+        pstats.Stats(stats.profiler, stream=out).sort_stats('cumulative').print_stats(PROFILE_LINES)
+        profiled = Response(out.getvalue(), 200, mimetype='text/plain')
+        profiled.headers['X-Profiled-Status'] = str(response.status_code)
+        return profiled
+    return response
+
+
+metrics = Metrics(n_plus_one_threshold=app.config['N_PLUS_ONE_THRESHOLD'])
@@ -1,10 +1,8 @@
 from sqlalchemy_serializer import SerializerMixin
 from sqlalchemy.orm import validates, relationship
 from sqlalchemy import UniqueConstraint
-from flask_bcrypt import Bcrypt
 from .config import db
-
-bcrypt = Bcrypt()
+from .passwords import password_hasher
 
 # Models go here!
 class Port(db.Model, SerializerMixin):
@@ -26,6 +24,10 @@ class Port(db.Model, SerializerMixin):
     )
     serialize_rules = ('-origin_pairs', '-dest_pairs',)
 
+    __table_args__ = (
+        db.Index('ix_ports_code', 'code', unique=True),
+    )
+
     @validates('code')
     def validate_code(self, key, val):
         assert val and len(val) == 5 and val.isupper()
@@ -72,6 +74,7 @@ class PortPair(db.Model, SerializerMixin):
 
     __table_args__ = (
         UniqueConstraint('origin_port_id', 'destination_port_id', name='uniq_pair'),
+        db.Index('ix_port_pairs_destination_port_id', 'destination_port_id'),
     )
 
 class Rate(db.Model, SerializerMixin):
@@ -81,12 +84,17 @@ class Rate(db.Model, SerializerMixin):
         '-container_type.rates',
         '-quote_rates',
     )
+    datetime_format = '%Y-%m-%dT%H:%M:%SZ'
 
     id = db.Column(db.Integer, primary_key=True)
     port_pair_id = db.Column(db.Integer, db.ForeignKey('port_pairs.id'), nullable=False)
     container_type_id = db.Column(db.Integer, db.ForeignKey('container_types.id'), nullable=False)
     base_rate = db.Column(db.Float, nullable=False, default=0.0)
     transit_days = db.Column(db.Integer, nullable=True)
+    # Valid from effective_from (inclusive) to effective_to (exclusive), in
+    # UTC; NULL leaves that end open.
+    effective_from = db.Column(db.DateTime, nullable=True)
+    effective_to = db.Column(db.DateTime, nullable=True)
 
     port_pair = relationship("PortPair", back_populates="rates")
     container_type = relationship("ContainerType", back_populates="rates")
@@ -96,6 +104,37 @@ class Rate(db.Model, SerializerMixin):
         back_populates="rate",
         cascade="all, delete-orphan",
 )
+
+    __table_args__ = (
+        # Lane lookups ordered by price, and per-container-type filters.
+        db.Index('ix_rates_port_pair_id_container_type_id_base_rate',
+                 'port_pair_id', 'container_type_id', 'base_rate'),
+        db.Index('ix_rates_container_type_id_base_rate', 'container_type_id', 'base_rate'),
+        # As-of lookups per lane, and finding expired rates to archive.
+        db.Index('ix_rates_port_pair_id_container_type_id_effective_from',
+                 'port_pair_id', 'container_type_id', 'effective_from', 'effective_to'),
+        db.Index('ix_rates_effective_to', 'effective_to'),
+    )
+
+class ArchivedRate(db.Model, SerializerMixin):
+    """Expired rates moved out of ``rates`` by compaction, ids unchanged."""
+    __tablename__ = 'rates_archive'
+    datetime_format = Rate.datetime_format
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    # No foreign keys: archived rows outlive the lanes they were priced on.
+    port_pair_id = db.Column(db.Integer, nullable=False)
+    container_type_id = db.Column(db.Integer, nullable=False)
+    base_rate = db.Column(db.Float, nullable=False)
+    transit_days = db.Column(db.Integer, nullable=True)
+    effective_from = db.Column(db.DateTime, nullable=True)
+    effective_to = db.Column(db.DateTime, nullable=False)
+    archived_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now())
+
+    __table_args__ = (
+        db.Index('ix_rates_archive_port_pair_id_container_type_id_effective_to',
+                 'port_pair_id', 'container_type_id', 'effective_to'),
+    )
     
 class User(db.Model, SerializerMixin):
     __tablename__ = 'users'
@@ -112,19 +151,35 @@ class User(db.Model, SerializerMixin):
     )
 
     def set_password(self, password):
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return bcrypt.check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
     
 class Quote(db.Model, SerializerMixin):
     __tablename__ = 'quotes'
-    serialize_rules = ('-user.quotes', '-quote_rates.quote',)
+    serialize_rules = ('-user', '-quote_rates.quote',)
 
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String, nullable=False)
     status = db.Column(db.String, nullable=False, default='Confirmed')
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # Materialized from the lines by set_totals() whenever they change.
+    line_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    total_base_rate = db.Column(db.Float, nullable=False, default=0.0, server_default='0')
+    max_transit_days = db.Column(db.Integer, nullable=True)
+
+    # Updates are issued as UPDATE ... WHERE id = ? AND version = ?; callers
+    # bump `version` themselves so line-only edits count as changes too.
+    __mapper_args__ = {"version_id_col": version, "version_id_generator": False}
+
+    __table_args__ = (
+        # Keyset-paginated listing per user, by id or filtered by status.
+        db.Index('ix_quotes_user_id_id', 'user_id', 'id'),
+        db.Index('ix_quotes_user_id_status_id', 'user_id', 'status', 'id'),
+        db.Index('ix_quotes_user_id_title_id', 'user_id', 'title', 'id'),
+    )
 
     user = relationship("User", back_populates="quotes")
 
@@ -134,9 +189,14 @@ class Quote(db.Model, SerializerMixin):
         cascade="all, delete-orphan",
     )
 
-    @property
-    def rates(self):
-        return [qr.rate for qr in self.quote_rates]
+    def set_totals(self, lines):
+        """Materialize count, total and slowest transit of ``lines``, dicts
+        with ``base_rate``, ``transit_days`` and optionally ``quantity``."""
+        lines = list(lines)
+        transit = [l["transit_days"] for l in lines if l["transit_days"] is not None]
+        self.line_count = len(lines)
+        self.total_base_rate = sum(l["base_rate"] * l.get("quantity", 1) for l in lines)
+        self.max_transit_days = max(transit) if transit else None
     
     @validates('status')
     def validate_status(self, key, value):
@@ -147,17 +207,39 @@ class Quote(db.Model, SerializerMixin):
     
 class QuoteRate(db.Model, SerializerMixin):
     __tablename__ = 'quote_rates'
+    serialize_rules = ('-quote', '-rate',)
 
     id = db.Column(db.Integer, primary_key=True)
     quote_id = db.Column(db.Integer, db.ForeignKey('quotes.id'), nullable=False)
     rate_id = db.Column(db.Integer, db.ForeignKey('rates.id'), nullable=False)
+    # The rate as priced when the line was added; later rate edits do not
+    # change the quote.
+    base_rate = db.Column(db.Float, nullable=False, default=0.0, server_default='0')
+    transit_days = db.Column(db.Integer, nullable=True)
+    origin_code = db.Column(db.String, nullable=True)
+    destination_code = db.Column(db.String, nullable=True)
+    container_code = db.Column(db.String, nullable=True)
+    # How many containers the line is for; the quote total counts each.
+    quantity = db.Column(db.Integer, nullable=False, default=1, server_default='1')
 
     quote = relationship("Quote", back_populates="quote_rates")
     rate = relationship("Rate", back_populates="quote_rates")
 
     __table_args__ = (
         UniqueConstraint('quote_id', 'rate_id', name='uniq_quote_rate'),
+        db.Index('ix_quote_rates_rate_id', 'rate_id'),
     )
 
-        
+class ChangeLog(db.Model, SerializerMixin):
+    """One row per insert, update or delete of a synced table; ``id`` is the
+    cursor handed to /changes clients."""
+    __tablename__ = 'change_log'
+
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String, nullable=False)
+    row_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String, nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now())
 
+    # AUTOINCREMENT so SQLite never reuses an id after the newest rows are pruned.
+    __table_args__ = {'sqlite_autoincrement': True}
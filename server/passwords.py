@@ -0,0 +1,112 @@
+"""Password hashing on a small dedicated thread pool.
+
+bcrypt releases the GIL while it works, so running it on a fixed number of
+threads caps how many cores login/signup traffic can occupy at once. Work
+beyond ``PASSWORD_HASH_WORKERS`` running plus ``PASSWORD_HASH_QUEUE``
+waiting is refused with ``PasswordHasherBusy`` so callers can answer 503
+instead of piling up request workers.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask_bcrypt import Bcrypt
+
+try:
+    from .config import app
+except ImportError:
+    from config import app
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class PasswordHasherBusy(Exception):
+    retry_after = 1
+
+
+class PasswordHasher:
+    def __init__(self, workers=2, max_queue=16, rounds=12):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.rounds = rounds
+        self._bcrypt = Bcrypt()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._rejected = 0
+        self._max_pending = 0
+        self._latency = {
+            op: {"count": 0, "sum": 0.0, "max": 0.0, "buckets": [0] * len(LATENCY_BUCKETS)}
+            for op in ('hash', 'verify')
+        }
+
+    def hash(self, password):
+        return self._submit('hash', self._bcrypt.generate_password_hash, password, self.rounds).decode('utf-8')
+
+    def verify(self, password_hash, password):
+        return self._submit('verify', self._bcrypt.check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        try:
+            return int(password_hash.split('$')[2]) != self.rounds
+        except (AttributeError, IndexError, ValueError):
+            return True
+
+    def _submit(self, op, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise PasswordHasherBusy()
+        with self._lock:
+            self._pending += 1
+            self._max_pending = max(self._max_pending, self._pending)
+        try:
+            return self._pool.submit(self._run, op, fn, *args).result()
+        finally:
+            with self._lock:
+                self._pending -= 1
+            self._slots.release()
+
+    def _run(self, op, fn, *args):
+        with self._lock:
+            self._running += 1
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._running -= 1
+                stats = self._latency[op]
+                stats["count"] += 1
+                stats["sum"] += elapsed
+                stats["max"] = max(stats["max"], elapsed)
+                for i, bound in enumerate(LATENCY_BUCKETS):
+                    if elapsed <= bound:
+                        stats["buckets"][i] += 1
+                        break
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "rounds": self.rounds,
+                "running": self._running,
+                "queued": self._pending - self._running,
+                "max_in_flight": self._max_pending,
+                "rejected": self._rejected,
+                "latency_buckets": list(LATENCY_BUCKETS),
+                "latency": {
+                    op: {**s, "buckets": list(s["buckets"])} for op, s in self._latency.items()
+                },
+            }
+
+
+password_hasher = PasswordHasher(
+    workers=app.config['PASSWORD_HASH_WORKERS'],
+    max_queue=app.config['PASSWORD_HASH_QUEUE'],
+    rounds=app.config['BCRYPT_LOG_ROUNDS'],
+)
@@ -0,0 +1,275 @@
+"""Typeahead search over port names and codes.
+
+Normalized codes, full names and every word-start suffix of a name ("new
+york" also as "york") are kept in sorted arrays, so a prefix query is a
+bisect plus a short scan. Results come in tiers: exact code, code prefix,
+name prefix, word prefix, then fuzzy matches, meaning names that start with
+the query after one typo (a missing, extra, wrong or swapped character).
+Tiers are sorted alphabetically, which puts shorter names first.
+
+The index is built on first use and kept in step the same way as the rate
+index: this process's commits are applied in place, and any other change to
+the ``ports`` table version triggers a rebuild.
+"""
+import threading
+import unicodedata
+from bisect import bisect_left
+
+from sqlalchemy import event
+
+try:
+    from .config import db
+    from .models import Port
+    from .versions import table_versions
+except ImportError:
+    from config import db
+    from models import Port
+    from versions import table_versions
+
+MAX_LIMIT = 50
+# Shorter queries match too much for a typo to tell anything apart.
+FUZZY_MIN_LENGTH = 3
+
+
+def normalize(text):
+    """Lower-case ASCII, with accents and punctuation folded away."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    return ' '.join(''.join(c if c.isalnum() else ' ' for c in text).split())
+
+
+def _word_suffixes(name):
+    return [name[i + 1:] for i, c in enumerate(name) if c == ' ']
+
+
+class _SortedKeys:
+    """Parallel sorted lists of (key, port id)."""
+    __slots__ = ('keys', 'ids')
+
+    def __init__(self, pairs=()):
+        pairs = sorted(pairs)
+        self.keys = [k for k, _ in pairs]
+        self.ids = [i for _, i in pairs]
+
+    def add(self, key, pid):
+        i = bisect_left(self.keys, key)
+        self.keys.insert(i, key)
+        self.ids.insert(i, pid)
+
+    def remove(self, key, pid):
+        i = bisect_left(self.keys, key)
+        while i < len(self.keys) and self.keys[i] == key:
+            if self.ids[i] == pid:
+                del self.keys[i]
+                del self.ids[i]
+                return
+            i += 1
+
+    def has_prefix(self, prefix):
+        i = bisect_left(self.keys, prefix)
+        return i < len(self.keys) and self.keys[i].startswith(prefix)
+
+    def next_chars(self, prefix):
+        """The distinct characters that follow ``prefix`` in some key."""
+        keys, n = self.keys, len(prefix)
+        i = bisect_left(keys, prefix)
+        chars = []
+        while i < len(keys) and keys[i].startswith(prefix):
+            if len(keys[i]) == n:
+                i += 1
+                continue
+            c = keys[i][n]
+            chars.append(c)
+            i = bisect_left(keys, prefix + chr(ord(c) + 1), i)
+        return chars
+
+    def prefixed(self, prefix, limit):
+        """Ids of up to ``limit`` keys starting with ``prefix``, in key order."""
+        keys, ids = self.keys, self.ids
+        i = bisect_left(keys, prefix)
+        out = []
+        while i < len(keys) and len(out) < limit and keys[i].startswith(prefix):
+            out.append((keys[i], ids[i]))
+            i += 1
+        return out
+
+
+class _PortTables:
+    """One consistent copy of the search structures."""
+    __slots__ = ('synced', 'ports', 'codes', 'names', 'words', 'terms')
+
+    def __init__(self, synced=None, rows=()):
+        # Version of ``ports`` this copy reflects; None until it is loaded.
+        self.synced = synced
+        self.ports = {}
+        codes, names, words = [], [], []
+        for pid, name, code in rows:
+            norm = normalize(name)
+            self.ports[pid] = (name, code, norm)
+            codes.append((normalize(code), pid))
+            names.append((norm, pid))
+            words.extend((w, pid) for w in _word_suffixes(norm))
+        self.codes = _SortedKeys(codes)
+        self.names = _SortedKeys(names)
+        self.words = _SortedKeys(words)
+        # names and words together, for fuzzy matching
+        self.terms = _SortedKeys(names + words)
+
+    def put(self, pid, name, code):
+        if pid in self.ports:
+            self.drop(pid)
+        norm = normalize(name)
+        self.ports[pid] = (name, code, norm)
+        self.codes.add(normalize(code), pid)
+        self.names.add(norm, pid)
+        self.terms.add(norm, pid)
+        for w in _word_suffixes(norm):
+            self.words.add(w, pid)
+            self.terms.add(w, pid)
+
+    def drop(self, pid):
+        name, code, norm = self.ports.pop(pid)
+        self.codes.remove(normalize(code), pid)
+        self.names.remove(norm, pid)
+        self.terms.remove(norm, pid)
+        for w in _word_suffixes(norm):
+            self.words.remove(w, pid)
+            self.terms.remove(w, pid)
+
+
+class PortSearch:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._tables = _PortTables()
+
+    # -- loading -----------------------------------------------------------
+
+    def _current(self):
+        """The loaded tables, rebuilt first if ``ports`` has moved on.
+
+        A rebuild fills new tables and publishes them with one assignment,
+        so a search that already holds the old ones never sees them emptied.
+        """
+        tables = self._tables
+        if tables.synced is not None and table_versions.get('ports') == tables.synced:
+            return tables
+        with self._lock:
+            synced = table_versions.get('ports')
+            tables = self._tables
+            if tables.synced is not None and synced == tables.synced:
+                return tables
+            tables = _PortTables(synced, db.session.query(Port.id, Port.name, Port.code))
+            self._tables = tables
+            return tables
+
+    def ensure_loaded(self):
+        self._current()
+
+    # -- change tracking ---------------------------------------------------
+
+    def install(self, session):
+        event.listen(session, 'after_flush', self._collect)
+        event.listen(session, 'after_commit', self._apply)
+        event.listen(session, 'after_soft_rollback', self._discard)
+
+    def _collect(self, session, flush_context):
+        pending = session.info.setdefault('port_search_changes', [])
+        for obj in list(session.new) + list(session.dirty):
+            if isinstance(obj, Port):
+                pending.append((obj.id, obj.name, obj.code))
+        for obj in session.deleted:
+            if isinstance(obj, Port):
+                pending.append((obj.id, None, None))
+
+    def _discard(self, session, previous_transaction):
+        session.info.pop('port_search_changes', None)
+
+    def _apply(self, session):
+        pending = session.info.pop('port_search_changes', None)
+        bumped = (session.info.get('bumped_tables') or {}).get('ports')
+        if not pending:
+            return
+        with self._lock:
+            tables = self._tables
+            if tables.synced is None:
+                return
+            # As in the rate index: only adopt the new version if it was our
+            # bump that moved it, otherwise the next search rebuilds.
+            if bumped and bumped[0] == tables.synced:
+                tables.synced = bumped[1]
+            for pid, name, code in pending:
+                if name is None:
+                    if pid in tables.ports:
+                        tables.drop(pid)
+                else:
+                    tables.put(pid, name, code)
+
+    # -- lookups -----------------------------------------------------------
+
+    def search(self, query, limit=10):
+        """Up to ``limit`` ``{id, name, code, match}`` dicts, best first."""
+        tables = self._current()
+        q = normalize(query)
+        if not q:
+            return []
+        with self._lock:
+            found = {}
+
+            def take(match, hits):
+                for _, pid in hits:
+                    if len(found) >= limit:
+                        return
+                    if pid not in found:
+                        found[pid] = match
+
+            # Ask each tier for enough hits to fill the page after dropping
+            # ports an earlier tier already returned.
+            codes = tables.codes.prefixed(q, 2 * limit)
+            take('code', [h for h in codes if h[0] == q])
+            take('code_prefix', codes)
+            take('name', tables.names.prefixed(q, 2 * limit))
+            take('word', tables.words.prefixed(q, 2 * limit))
+            if len(found) < limit and len(q) >= FUZZY_MIN_LENGTH:
+                hits = []
+                for variant in _edits(tables.terms, q):
+                    hits += tables.terms.prefixed(variant, limit)
+                # Matches at the start of a name before those on a later word.
+                ports = tables.ports
+                hits.sort(key=lambda h: (h[0] != ports[h[1]][2], h[0]))
+                take('fuzzy', hits)
+
+            ports = tables.ports
+            return [
+                {"id": pid, "name": ports[pid][0], "code": ports[pid][1], "match": match}
+                for pid, match in found.items()
+            ]
+
+
+def _edits(terms, q):
+    """Strings one typo (insertion, deletion, substitution or swap) away
+    from ``q`` that are a prefix of some name or word.
+
+    Only prefixes that exist are extended, like walking a trie: a typo
+    must sit within the longest matching prefix of ``q`` or right after
+    it, and substituted or inserted characters come from the index.
+    """
+    matched = 0
+    while matched < len(q) and terms.has_prefix(q[:matched + 1]):
+        matched += 1
+    candidates = set()
+    for i in range(matched + 1):
+        left, right = q[:i], q[i:]
+        if right:
+            candidates.add(left + right[1:])
+        if len(right) > 1:
+            candidates.add(left + right[1] + right[0] + right[2:])
+        for c in terms.next_chars(left):
+            if right:
+                candidates.add(left + c + right[1:])
+            candidates.add(left + c + right)
+    candidates.discard(q)
+    return [v for v in candidates if terms.has_prefix(v)]
+
+
+port_search = PortSearch()
+port_search.install(db.session)
@@ -0,0 +1,97 @@
+"""Pricing for shipment manifests.
+
+A manifest is a list of ``{origin, destination, container, quantity}``
+lines. Each distinct lane is looked up once in the in-memory rate index, so
+pricing thousands of lines costs no database round trips and a dictionary
+lookup per line.
+"""
+try:
+    from .rate_index import rate_index
+except ImportError:
+    from rate_index import rate_index
+
+MAX_LINES = 50000
+
+
+class ManifestError(ValueError):
+    pass
+
+
+def parse_manifest(lines):
+    """Validate raw manifest lines into (origin, destination, container, quantity) tuples."""
+    if not isinstance(lines, list) or not lines:
+        raise ManifestError("lines must be a non-empty list")
+    if len(lines) > MAX_LINES:
+        raise ManifestError(f"at most {MAX_LINES} lines per manifest")
+    parsed = []
+    for i, line in enumerate(lines):
+        if not isinstance(line, dict):
+            raise ManifestError(f"line {i}: must be an object")
+        origin = str(line.get("origin") or "").strip().upper()
+        destination = str(line.get("destination") or "").strip().upper()
+        container = str(line.get("container") or "").strip()
+        if not origin or not destination or not container:
+            raise ManifestError(f"line {i}: origin, destination and container are required")
+        try:
+            quantity = int(line.get("quantity", 1))
+        except (TypeError, ValueError):
+            raise ManifestError(f"line {i}: quantity must be an integer")
+        if quantity < 1:
+            raise ManifestError(f"line {i}: quantity must be positive")
+        parsed.append((origin, destination, container, quantity))
+    return parsed
+
+
+def price_manifest(lines, by="price", as_of=None):
+    """Price parsed manifest lines with the cheapest (or fastest) rate per
+    lane in force ``as_of`` (default now).
+
+    Returns the per-line results plus aggregates; lines without a rate carry
+    an ``error`` and are left out of the totals.
+    """
+    index = rate_index.view()
+    lanes = {}
+    results = []
+    total = 0.0
+    max_transit = None
+    unpriced = []
+    for i, (origin, destination, container, quantity) in enumerate(lines):
+        key = (origin, destination, container)
+        rate = lanes.get(key)
+        if rate is None and key not in lanes:
+            rate = lanes[key] = _best(index, origin, destination, container, by, as_of)
+        result = {"origin": origin, "destination": destination,
+                  "container": container, "quantity": quantity}
+        if rate is None:
+            result["error"] = "no rate for this lane"
+            unpriced.append(i)
+        else:
+            rate_id, base_rate, transit_days = rate
+            cost = base_rate * quantity
+            result.update(rate_id=rate_id, base_rate=base_rate,
+                          transit_days=transit_days, cost=cost)
+            total += cost
+            if transit_days is not None and (max_transit is None or transit_days > max_transit):
+                max_transit = transit_days
+        results.append(result)
+    return {
+        "lines": results,
+        "total_cost": total,
+        "max_transit_days": max_transit,
+        "priced": len(results) - len(unpriced),
+        "unpriced": unpriced,
+    }
+
+
+def _best(index, origin, destination, container, by, as_of):
+    origin_id = index.port_id(origin)
+    destination_id = index.port_id(destination)
+    ctid = index.container_type_id(container)
+    if origin_id is None or destination_id is None or ctid is None:
+        return None
+    rate_id = index.best(origin_id, destination_id, ctid, by=by, as_of=as_of)
+    row = index.rate(rate_id) if rate_id is not None else None
+    if row is None:
+        return None
+    _, _, base_rate, transit_days = row
+    return rate_id, base_rate, transit_days
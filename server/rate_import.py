@@ -0,0 +1,256 @@
+"""Bulk rate import from a streamed CSV or NDJSON body.
+
+Rows are parsed lazily, resolved against port/container code maps built once
+per import, and written in chunked transactions with executemany inserts.
+A chunk the database rejects is retried row by row, so only the rows at
+fault are reported and left out.
+Each input row needs ``origin``, ``destination``, ``container`` and
+``base_rate``; ``transit_days``, ``effective_from`` and ``effective_to`` are
+optional. Missing port pairs are created on the fly (insert-or-ignore on the
+unique lane constraint).
+
+With ``supersede``, the import is a new tariff: each row closes the rates of
+its lane and container type that existed before the import and are still
+in force at its ``effective_from`` (the start of the import if not given).
+"""
+import csv
+import json
+import math
+
+from sqlalchemy import and_, bindparam
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+try:
+    from .changes import log_inserted, log_matching, max_id
+    from .config import db
+    from .models import Port, PortPair, ContainerType, Rate
+    from .validity import overlapping, parse_interval, utcnow
+except ImportError:
+    from changes import log_inserted, log_matching, max_id
+    from config import db
+    from models import Port, PortPair, ContainerType, Rate
+    from validity import overlapping, parse_interval, utcnow
+
+CHUNK_SIZE = 5000
+MAX_REPORTED_ERRORS = 1000
+
+
+# Stands in for the row of a line that is not valid UTF-8.
+UNDECODABLE = object()
+
+
+def _lines(stream, undecodable):
+    """Decoded lines of ``stream``. Lines that are not valid UTF-8 are
+    replaced by blank ones and their numbers appended to ``undecodable``."""
+    for line_num, raw in enumerate(stream, start=1):
+        if isinstance(raw, bytes):
+            try:
+                raw = raw.decode('utf-8-sig')
+            except UnicodeDecodeError:
+                undecodable.append(line_num)
+                raw = '\n'
+        yield raw
+
+
+def parse_csv(stream):
+    """Yield (line number, row dict) pairs from a CSV stream with a header row."""
+    undecodable = []
+    reader = csv.DictReader(_lines(stream, undecodable))
+    for row in reader:
+        # The reader skips the blank stand-ins while reading ahead to ``row``.
+        while undecodable:
+            yield undecodable.pop(0), UNDECODABLE
+        yield reader.line_num, row
+    while undecodable:
+        yield undecodable.pop(0), UNDECODABLE
+
+
+def parse_ndjson(stream):
+    """Yield (line number, row dict) pairs from an NDJSON stream."""
+    undecodable = []
+    for line_num, line in enumerate(_lines(stream, undecodable), start=1):
+        if undecodable:
+            yield undecodable.pop(), UNDECODABLE
+            continue
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_num, None
+            continue
+        yield line_num, row if isinstance(row, dict) else None
+
+
+class RateImport:
+    def __init__(self, chunk_size=CHUNK_SIZE, supersede=False):
+        self.chunk_size = chunk_size
+        self.supersede = supersede
+        self.started_at = utcnow()
+        # Rates up to this id existed before the import; only those are superseded.
+        self.last_existing = max_id('rates')
+        self.inserted = 0
+        self.superseded = 0
+        self.pairs_created = 0
+        self.error_count = 0
+        self.errors = []
+        self.port_ids = dict(db.session.query(Port.code, Port.id))
+        self.container_ids = dict(db.session.query(ContainerType.code, ContainerType.id))
+        self.pair_ids = {
+            (oid, did): ppid
+            for ppid, oid, did in db.session.query(
+                PortPair.id, PortPair.origin_port_id, PortPair.destination_port_id
+            )
+        }
+
+    def error(self, line_num, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_num, "error": message})
+
+    def run(self, rows):
+        chunk = []
+        for line_num, row in rows:
+            chunk.append((line_num, row))
+            if len(chunk) >= self.chunk_size:
+                self._write(chunk)
+                chunk = []
+        if chunk:
+            self._write(chunk)
+        return self
+
+    def report(self):
+        return {
+            "inserted": self.inserted,
+            "superseded": self.superseded,
+            "pairs_created": self.pairs_created,
+            "error_count": self.error_count,
+            "errors": self.errors,
+        }
+
+    def _validate(self, line_num, row):
+        if row is UNDECODABLE:
+            self.error(line_num, "not valid UTF-8")
+            return None
+        if row is None:
+            self.error(line_num, "malformed row")
+            return None
+        origin = str(row.get("origin") or "").strip().upper()
+        dest = str(row.get("destination") or "").strip().upper()
+        container = str(row.get("container") or "").strip()
+        if not origin or not dest or not container:
+            self.error(line_num, "origin, destination and container are required")
+            return None
+        oid = self.port_ids.get(origin)
+        did = self.port_ids.get(dest)
+        if oid is None or did is None:
+            self.error(line_num, "unknown port code")
+            return None
+        if oid == did:
+            self.error(line_num, "origin and destination cannot be the same")
+            return None
+        ctid = self.container_ids.get(container)
+        if ctid is None:
+            self.error(line_num, "unknown container code")
+            return None
+        try:
+            base_rate = float(row.get("base_rate"))
+            transit = row.get("transit_days")
+            transit_days = int(transit) if transit not in (None, "") else None
+        except (TypeError, ValueError):
+            self.error(line_num, "base_rate and transit_days must be numbers")
+            return None
+        if not math.isfinite(base_rate) or base_rate < 0:
+            self.error(line_num, "base_rate must be a non-negative number")
+            return None
+        try:
+            effective_from, effective_to = parse_interval(row.get("effective_from"), row.get("effective_to"))
+        except ValueError:
+            self.error(line_num, "effective_from and effective_to must be ISO 8601 dates, "
+                                 "effective_to after effective_from")
+            return None
+        if self.supersede and effective_from is None:
+            effective_from = self.started_at
+            if effective_to is not None and effective_to <= effective_from:
+                self.error(line_num, "effective_to must be after the start of the import")
+                return None
+        return (oid, did), ctid, base_rate, transit_days, effective_from, effective_to
+
+    def _write(self, chunk):
+        valid = [(n, v) for n, v in ((n, self._validate(n, row)) for n, row in chunk) if v]
+        if not valid or self._insert([v for _, v in valid]):
+            return
+        # Something in the chunk was rejected: write its rows one at a time,
+        # so the others still go in and the bad ones are named.
+        for line_num, row in valid:
+            if not self._insert([row]):
+                self.error(line_num, "could not be written")
+
+    def _insert(self, valid):
+        """Write ``valid`` rows in one transaction; False if it failed."""
+        pair_ids, pairs_created = dict(self.pair_ids), self.pairs_created
+        try:
+            last_pair, last_rate = max_id('port_pairs'), max_id('rates')
+            missing = {row[0] for row in valid if row[0] not in self.pair_ids}
+            if missing:
+                self._create_pairs(missing)
+            db.session.execute(Rate.__table__.insert(), [
+                {
+                    "port_pair_id": self.pair_ids[lane],
+                    "container_type_id": ctid,
+                    "base_rate": base_rate,
+                    "transit_days": transit_days,
+                    "effective_from": effective_from,
+                    "effective_to": effective_to,
+                }
+                for lane, ctid, base_rate, transit_days, effective_from, effective_to in valid
+            ])
+            connection = db.session.connection()
+            if missing:
+                log_inserted(connection, 'port_pairs', last_pair)
+            log_inserted(connection, 'rates', last_rate)
+            superseded = self._supersede(connection, valid) if self.supersede else 0
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            self.pair_ids, self.pairs_created = pair_ids, pairs_created
+            return False
+        self.inserted += len(valid)
+        self.superseded += superseded
+        return True
+
+    def _supersede(self, connection, valid):
+        rates = Rate.__table__
+        params = [
+            {"pp": pp, "ct": ct, "start": start}
+            for pp, ct, start in sorted({
+                (self.pair_ids[lane], ctid, effective_from)
+                for lane, ctid, _, _, effective_from, _ in valid
+            })
+        ]
+        closing = and_(
+            rates.c.port_pair_id == bindparam("pp"),
+            rates.c.container_type_id == bindparam("ct"),
+            rates.c.id <= self.last_existing,
+            overlapping(rates.c, bindparam("start")),
+        )
+        log_matching(connection, 'rates', 'update', closing, params)
+        result = connection.execute(
+            rates.update().where(closing).values(effective_to=bindparam("start")), params)
+        return result.rowcount
+
+    def _create_pairs(self, lanes):
+        table = PortPair.__table__
+        insert = pg_insert if db.engine.dialect.name == 'postgresql' else sqlite_insert
+        db.session.execute(
+            insert(table).on_conflict_do_nothing(),
+            [{"origin_port_id": oid, "destination_port_id": did} for oid, did in lanes],
+        )
+        origin_ids = {oid for oid, _ in lanes}
+        for ppid, oid, did in db.session.query(
+            PortPair.id, PortPair.origin_port_id, PortPair.destination_port_id
+        ).filter(PortPair.origin_port_id.in_(origin_ids)):
+            if (oid, did) in lanes and (oid, did) not in self.pair_ids:
+                self.pair_ids[(oid, did)] = ppid
+                self.pairs_created += 1
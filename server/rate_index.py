@@ -0,0 +1,593 @@
+"""Per-process index of rates keyed by lane and container type.
+
+Rates for each (origin port, destination port, container type) are kept in
+compact arrays sorted by base_rate and by transit_days, so listing a lane or
+picking its cheapest/fastest rate never touches the database. A lane whose
+rates have validity dates is split into time segments, each with its own
+arrays, so the rates in force at any instant, now or ``as_of`` another
+time, are one bisection away however much history the lane holds.
+
+Any write, from this process or another, shows up as a table version the
+index has not seen. The index then catches up by replaying ``change_log``
+since its cursor, copy-on-write: each changed lane is rebuilt aside and
+published with one assignment, so lookups running meanwhile see either the
+old lane or the new one. Writes the log cannot replay (deleted ports, pairs
+or container types, unlogged bulk loads, a recreated or pruned log) rebuild
+the whole index in a background thread while the old one keeps serving.
+"""
+import math
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from heapq import merge
+
+try:
+    from .changes import StaleCursor, change_feed
+    from .config import app, db
+    from .models import Port, PortPair, ContainerType, Rate
+    from .routing import k_shortest_paths
+    from .validity import OPEN_END, OPEN_START, format_instant, to_seconds
+    from .versions import table_versions
+except ImportError:
+    from changes import StaleCursor, change_feed
+    from config import app, db
+    from models import Port, PortPair, ContainerType, Rate
+    from routing import k_shortest_paths
+    from validity import OPEN_END, OPEN_START, format_instant, to_seconds
+    from versions import table_versions
+
+NO_TRANSIT = float('inf')
+INDEX_TABLES = ('ports', 'port_pairs', 'container_types', 'rates')
+# More changes than this are cheaper to load from scratch than to replay.
+CATCH_UP_LIMIT = 20000
+
+
+class Lane:
+    """Rates of one lane, ordered by price and, separately, by transit time."""
+    __slots__ = ('price_keys', 'price_ids', 'transit_keys', 'transit_prices', 'transit_ids')
+
+    def __init__(self, rows=()):
+        # rows: (rate_id, base_rate, transit_days)
+        by_price = sorted(rows, key=lambda r: (r[1], r[0]))
+        by_transit = sorted(rows, key=lambda r: (_transit_key(r[2]), r[1], r[0]))
+        self.price_keys = array('d', [r[1] for r in by_price])
+        self.price_ids = array('q', [r[0] for r in by_price])
+        self.transit_keys = array('d', [_transit_key(r[2]) for r in by_transit])
+        self.transit_prices = array('d', [r[1] for r in by_transit])
+        self.transit_ids = array('q', [r[0] for r in by_transit])
+
+    def add(self, rate_id, base_rate, transit_days):
+        i = bisect_right(self.price_keys, base_rate)
+        self.price_keys.insert(i, base_rate)
+        self.price_ids.insert(i, rate_id)
+
+        # Equal transit times are kept cheapest first.
+        t = _transit_key(transit_days)
+        lo = bisect_left(self.transit_keys, t)
+        hi = bisect_right(self.transit_keys, t, lo)
+        i = bisect_right(self.transit_prices, base_rate, lo, hi)
+        self.transit_keys.insert(i, t)
+        self.transit_prices.insert(i, base_rate)
+        self.transit_ids.insert(i, rate_id)
+
+    def copy(self):
+        lane = Lane.__new__(Lane)
+        for name in Lane.__slots__:
+            setattr(lane, name, array(getattr(self, name).typecode, getattr(self, name)))
+        return lane
+
+    def remove(self, rate_id):
+        i = self.price_ids.index(rate_id)
+        del self.price_keys[i]
+        del self.price_ids[i]
+        i = self.transit_ids.index(rate_id)
+        del self.transit_keys[i]
+        del self.transit_prices[i]
+        del self.transit_ids[i]
+
+    def __len__(self):
+        return len(self.price_ids)
+
+
+def _transit_key(transit_days):
+    return NO_TRANSIT if transit_days is None else float(transit_days)
+
+
+class Timeline:
+    """Rates of one lane over time; never changed once published.
+
+    ``layout`` is ``(bounds, segments)``: ``bounds`` holds every distinct
+    finite validity date of the lane's rates in order, and ``segments[i]``
+    the rates valid from ``bounds[i - 1]`` up to ``bounds[i]``. Both are
+    replaced together, as one tuple. A segment is kept as its rows until a
+    lookup first lands in it, so history nobody asks about costs no sorting;
+    two readers racing to sort it build equal Lanes.
+    """
+    __slots__ = ('rows', 'layout')
+
+    def __init__(self, rows=(), layout=None):
+        # rows: (rate_id, base_rate, transit_days, start, end), seconds
+        self.rows = rows if isinstance(rows, dict) else {r[0]: r for r in rows}
+        self.layout = layout or _layout(self.rows.values())
+
+    def at(self, t):
+        """The Lane of rates in force at ``t`` (seconds since the epoch)."""
+        bounds, segments = self.layout
+        if not bounds:
+            return segments[0]
+        i = bisect_right(bounds, t)
+        lane = segments[i]
+        if not isinstance(lane, Lane):
+            lane = segments[i] = Lane(lane)
+        return lane
+
+    def with_rate(self, rate_id, base_rate, transit_days, start=OPEN_START, end=OPEN_END):
+        """A copy of the timeline with the rate added or replaced."""
+        rows = dict(self.rows)
+        old = rows.get(rate_id)
+        rows[rate_id] = (rate_id, base_rate, transit_days, start, end)
+        bounds, segments = self.layout
+        # Lanes whose rates are all open ended have one segment, copied and
+        # updated rather than rebuilt.
+        if not bounds and start == OPEN_START and end == OPEN_END:
+            lane = segments[0].copy()
+            if old is not None:
+                lane.remove(rate_id)
+            lane.add(rate_id, base_rate, transit_days)
+            return Timeline(rows, (bounds, [lane]))
+        return Timeline(rows)
+
+    def without_rate(self, rate_id):
+        """A copy of the timeline without the rate, or None if it is empty."""
+        rows = dict(self.rows)
+        del rows[rate_id]
+        if not rows:
+            return None
+        bounds, segments = self.layout
+        if not bounds:
+            lane = segments[0].copy()
+            lane.remove(rate_id)
+            return Timeline(rows, (bounds, [lane]))
+        return Timeline(rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+
+def _layout(rows):
+    starts, ends, active = {}, {}, {}
+    for r in rows:
+        if r[3] == OPEN_START:
+            active[r[0]] = r[:3]
+        else:
+            starts.setdefault(r[3], []).append(r)
+        if r[4] != OPEN_END:
+            ends.setdefault(r[4], []).append(r[0])
+    bounds = array('d', sorted(starts.keys() | ends.keys()))
+    if not bounds:
+        return bounds, [Lane(active.values())]
+    # Sweep the bounds in order, keeping the rates in force between them.
+    segments = [list(active.values())]
+    for t in bounds:
+        for rid in ends.get(t, ()):
+            active.pop(rid, None)
+        for r in starts.get(t, ()):
+            active[r[0]] = r[:3]
+        segments.append(list(active.values()))
+    return bounds, segments
+
+
+class IndexState:
+    """The index data.
+
+    Rebuilds fill a new IndexState and publish it with a single assignment.
+    Catching up changes the published state, under the index lock, one key
+    at a time: a rate's row and validity are replaced whole, and its lane is
+    replaced by a changed copy, so readers never see a lane mid-change. A
+    reader may still find a rate id it got from a lane gone by the time it
+    asks for the rate, which lookups answer with None.
+    """
+
+    def __init__(self, lock, synced=None, cursor=0):
+        self._lock = lock
+        # Table versions this state reflects; None until it has been loaded.
+        self.synced = synced
+        # Last change_log id this state reflects.
+        self.cursor = cursor
+        self._ports = {}
+        self._port_ids = {}
+        self._pairs = {}
+        self._pair_dicts = {}
+        self._containers = {}
+        self._container_ids = {}
+        self._rates = {}
+        # rate_id -> (start, end, effective_from, effective_to) for rates
+        # with any validity date: seconds, then the API's text.
+        self._validity = {}
+        # Every distinct validity date, with how many rates use it.
+        self._bounds = array('d')
+        self._bound_refs = {}
+        # datetime -> (seconds, text), computed once per distinct date.
+        self._instants = {}
+        self._lanes = {}
+        # container_type_id -> origin port id -> destination port id -> Timeline
+        self._adjacency = {}
+
+    # -- loading -----------------------------------------------------------
+
+    def load(self, session):
+        for pid, name, code in session.query(Port.id, Port.name, Port.code):
+            self._put_port(pid, name, code)
+        for ppid, oid, did in session.query(
+            PortPair.id, PortPair.origin_port_id, PortPair.destination_port_id
+        ):
+            self._put_pair(ppid, oid, did)
+        for ctid, code, desc in session.query(
+            ContainerType.id, ContainerType.code, ContainerType.description
+        ):
+            self._put_container(ctid, code, desc)
+        grouped = {}
+        for rid, ppid, ctid, base_rate, transit_days, effective_from, effective_to in session.query(
+            Rate.id, Rate.port_pair_id, Rate.container_type_id,
+            Rate.base_rate, Rate.transit_days, Rate.effective_from, Rate.effective_to,
+        ):
+            if ppid not in self._pairs or ctid not in self._containers:
+                continue
+            base_rate = float(base_rate)
+            self._rates[rid] = (ppid, ctid, base_rate, transit_days)
+            start, end = self._put_validity(rid, effective_from, effective_to)
+            grouped.setdefault(self._pairs[ppid] + (ctid,), []).append(
+                (rid, base_rate, transit_days, start, end))
+        for key, rows in grouped.items():
+            self._set_lane(key, Timeline(rows))
+
+    def apply(self, changes):
+        """Apply ``change_feed.changed_rows()`` output; raises _Stale for
+        changes that need a rebuild."""
+        for _, table, op, row_id, row in sorted(changes, key=lambda c: _APPLY_ORDER[c[1]]):
+            if op == 'delete':
+                if table != 'rates':
+                    # Deletes cascade to rates without being logged for them.
+                    raise _Stale()
+                if row_id in self._rates:
+                    self._drop_rate(row_id)
+            elif table == 'rates':
+                self._put_rate(*row)
+            elif table == 'port_pairs':
+                self._put_pair(*row)
+            elif table == 'ports':
+                self._put_port(*row)
+            else:
+                self._put_container(*row)
+
+    def _put_port(self, pid, name, code):
+        old = self._ports.get(pid)
+        self._ports[pid] = {"id": pid, "name": name, "code": code}
+        self._port_ids[code] = pid
+        if old and old["code"] != code and self._port_ids.get(old["code"]) == pid:
+            del self._port_ids[old["code"]]
+        for ppid, (oid, did) in list(self._pairs.items()):
+            if pid in (oid, did):
+                self._pair_dicts.pop(ppid, None)
+
+    def _put_pair(self, ppid, oid, did):
+        if ppid in self._pairs and self._pairs[ppid] != (oid, did):
+            # Moving a pair to other ports re-keys every lane it owns.
+            raise _Stale()
+        self._pairs[ppid] = (oid, did)
+        self._pair_dicts.pop(ppid, None)
+
+    def _put_container(self, ctid, code, desc):
+        old = self._containers.get(ctid)
+        self._containers[ctid] = {"id": ctid, "code": code, "description": desc}
+        self._container_ids[code] = ctid
+        if old and old["code"] != code and self._container_ids.get(old["code"]) == ctid:
+            del self._container_ids[old["code"]]
+
+    def _put_rate(self, rid, ppid, ctid, base_rate, transit_days, effective_from=None, effective_to=None):
+        if ppid not in self._pairs or ctid not in self._containers:
+            raise _Stale()
+        base_rate = float(base_rate)
+        old = self._rates.get(rid)
+        # The row before the lane, so a reader that finds the rate in the
+        # new lane can always look it up.
+        self._rates[rid] = (ppid, ctid, base_rate, transit_days)
+        start, end = self._put_validity(rid, effective_from, effective_to)
+        key = self._pairs[ppid] + (ctid,)
+        if old is not None:
+            old_key = self._pairs[old[0]] + (old[1],)
+            if old_key != key:
+                self._set_lane(old_key, self._lanes[old_key].without_rate(rid))
+        lane = self._lanes.get(key) or Timeline()
+        self._set_lane(key, lane.with_rate(rid, base_rate, transit_days, start, end))
+
+    def _instant(self, dt, open_end):
+        if dt is None:
+            return open_end, None
+        instant = self._instants.get(dt)
+        if instant is None:
+            instant = self._instants[dt] = (to_seconds(dt, None), format_instant(dt))
+        return instant
+
+    def _put_validity(self, rid, effective_from, effective_to):
+        old = self._validity.get(rid)
+        if effective_from is None and effective_to is None:
+            self._validity.pop(rid, None)
+            start, end = OPEN_START, OPEN_END
+        else:
+            start, from_text = self._instant(effective_from, OPEN_START)
+            end, to_text = self._instant(effective_to, OPEN_END)
+            self._validity[rid] = (start, end, from_text, to_text)
+            for t in (start, end):
+                if math.isfinite(t):
+                    if t not in self._bound_refs:
+                        insort(self._bounds, t)
+                    self._bound_refs[t] = self._bound_refs.get(t, 0) + 1
+        if old is not None:
+            self._release_bounds(old)
+        return start, end
+
+    def _release_bounds(self, validity):
+        for t in validity[:2]:
+            if math.isfinite(t):
+                self._bound_refs[t] -= 1
+                if not self._bound_refs[t]:
+                    del self._bound_refs[t]
+                    del self._bounds[bisect_left(self._bounds, t)]
+
+    def _drop_rate(self, rid):
+        ppid, ctid, _, _ = self._rates[rid]
+        key = self._pairs[ppid] + (ctid,)
+        self._set_lane(key, self._lanes[key].without_rate(rid))
+        del self._rates[rid]
+        validity = self._validity.pop(rid, None)
+        if validity is not None:
+            self._release_bounds(validity)
+
+    def _set_lane(self, key, timeline):
+        """Publish ``timeline`` for the lane, or remove the lane for None."""
+        oid, did, ctid = key
+        if timeline is None:
+            self._lanes.pop(key, None)
+            self._adjacency.get(ctid, {}).get(oid, {}).pop(did, None)
+        else:
+            self._lanes[key] = timeline
+            self._adjacency.setdefault(ctid, {}).setdefault(oid, {})[did] = timeline
+
+    # -- lookups -----------------------------------------------------------
+
+    def port_id(self, code):
+        return self._port_ids.get(code)
+
+    def container_type_id(self, code):
+        return self._container_ids.get(code)
+
+    def rate_ids(self, port_pair_id=None, container_type_id=None, as_of=None):
+        """Ids of the rates in force ``as_of`` (default now) matching the
+        filters, cheapest first."""
+        t = _seconds(as_of)
+        if port_pair_id is not None:
+            pair = self._pairs.get(port_pair_id)
+            if pair is None:
+                return []
+            if container_type_id is not None:
+                lane = self._lanes.get(pair + (container_type_id,))
+                return list(lane.at(t).price_ids) if lane else []
+            lanes = [l.at(t) for k, l in list(self._lanes.items()) if k[:2] == pair]
+        elif container_type_id is not None:
+            lanes = [l.at(t) for k, l in list(self._lanes.items()) if k[2] == container_type_id]
+        else:
+            lanes = [l.at(t) for l in list(self._lanes.values())]
+        lanes = [l for l in lanes if len(l)]
+        if len(lanes) == 1:
+            return list(lanes[0].price_ids)
+        runs = [zip(l.price_keys, l.price_ids) for l in lanes]
+        return [rid for _, rid in merge(*runs)]
+
+    def best(self, origin_id, destination_id, container_type_id, by='price', as_of=None):
+        """Cheapest (``by='price'``) or fastest (``by='transit'``) rate id
+        in force ``as_of`` (default now)."""
+        timeline = self._lanes.get((origin_id, destination_id, container_type_id))
+        if not timeline:
+            return None
+        lane = timeline.at(_seconds(as_of))
+        if not lane:
+            return None
+        return lane.price_ids[0] if by == 'price' else lane.transit_ids[0]
+
+    def in_force(self, rate_id, as_of=None):
+        """Whether the rate exists and is valid ``as_of`` (default now)."""
+        if rate_id not in self._rates:
+            return False
+        validity = self._validity.get(rate_id)
+        if validity is None:
+            return True
+        t = _seconds(as_of)
+        return validity[0] <= t < validity[1]
+
+    def period(self, as_of=None):
+        """Start of the span of time, around ``as_of`` (default now), in which
+        no rate becomes valid or expires: what is in force changes only when
+        this does or the rates table does."""
+        i = bisect_right(self._bounds, _seconds(as_of))
+        return self._bounds[i - 1] if i else OPEN_START
+
+    def rate(self, rate_id):
+        """``(port_pair_id, container_type_id, base_rate, transit_days)`` or None."""
+        return self._rates.get(rate_id)
+
+    def line_snapshot(self, rate_id):
+        """The fields a quote line copies from a rate, or None if it does not exist."""
+        row = self._rates.get(rate_id)
+        if row is None:
+            return None
+        ppid, ctid, base_rate, transit_days = row
+        oid, did = self._pairs[ppid]
+        return {
+            "rate_id": rate_id,
+            "base_rate": base_rate,
+            "transit_days": transit_days,
+            "origin_code": self._ports[oid]["code"],
+            "destination_code": self._ports[did]["code"],
+            "container_code": self._containers[ctid]["code"],
+        }
+
+    def routes(self, origin_id, destination_id, container_type_id, by='price', k=3, max_legs=None,
+               as_of=None):
+        """Up to ``k`` multi-leg routes, each a list of rate ids, best first.
+
+        Every leg uses its lane's cheapest (or fastest) rate in force
+        ``as_of`` (default now); edge weights are read from the live lanes,
+        so no graph rebuild is needed when rates change.
+        """
+        t = _seconds(as_of)
+        keys, ids = ('price_keys', 'price_ids') if by == 'price' else ('transit_keys', 'transit_ids')
+
+        def weight(timeline):
+            lane = timeline.at(t)
+            return getattr(lane, keys)[0] if lane else math.inf
+
+        def head(timeline):
+            return getattr(timeline.at(t), ids)[0]
+
+        # Catching up adds and removes lanes under the lock.
+        with self._lock:
+            adjacency = self._adjacency.get(container_type_id, {})
+            paths = k_shortest_paths(adjacency, weight, origin_id, destination_id, k, max_hops=max_legs)
+            return [[head(adjacency[u][v]) for u, v in zip(p, p[1:])] for p in paths]
+
+    def rate_dict(self, rate_id):
+        """Same shape as ``Rate.to_dict(rules=('port_pair', 'container_type'))``,
+        or None if the rate is gone."""
+        row = self._rates.get(rate_id)
+        if row is None:
+            return None
+        ppid, ctid, base_rate, transit_days = row
+        _, _, effective_from, effective_to = self._validity.get(rate_id, _OPEN)
+        return {
+            "id": rate_id,
+            "port_pair_id": ppid,
+            "container_type_id": ctid,
+            "base_rate": base_rate,
+            "transit_days": transit_days,
+            "effective_from": effective_from,
+            "effective_to": effective_to,
+            "port_pair": self._pair_dict(ppid),
+            "container_type": dict(self._containers[ctid]),
+        }
+
+    def _pair_dict(self, ppid):
+        d = self._pair_dicts.get(ppid)
+        if d is None:
+            oid, did = self._pairs[ppid]
+            d = self._pair_dicts[ppid] = {
+                "id": ppid,
+                "origin_port_id": oid,
+                "destination_port_id": did,
+                "origin_port": self._ports[oid],
+                "destination_port": self._ports[did],
+            }
+        return {**d, "origin_port": dict(d["origin_port"]),
+                "destination_port": dict(d["destination_port"])}
+
+
+class RateIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._state = IndexState(self._lock)
+        self._rebuilding = False
+
+    def view(self):
+        """The current IndexState, caught up first if the tables have moved on.
+
+        While a rebuild runs in the background this is the previous state.
+        Requests that make several lookups should make them all on one view.
+        """
+        state = self._state
+        if state.synced is not None and (
+                self._rebuilding or table_versions.snapshot(INDEX_TABLES) == state.synced):
+            return state
+        with self._lock:
+            state = self._state
+            synced = table_versions.snapshot(INDEX_TABLES)
+            if state.synced is None:
+                # Nothing to serve yet, so the first load is waited for.
+                return self._rebuild()
+            if synced != state.synced and not self._rebuilding and not self._catch_up(state, synced):
+                self._rebuild_in_background()
+            return state
+
+    def ensure_loaded(self):
+        """Bring the index up to date before returning, rebuilding if need be."""
+        with self._lock:
+            state = self._state
+            synced = table_versions.snapshot(INDEX_TABLES)
+            if state.synced is None or (synced != state.synced and not self._catch_up(state, synced)):
+                self._rebuild()
+
+    def _catch_up(self, state, synced):
+        """Replay ``change_log`` onto ``state``; False if it needs a rebuild."""
+        try:
+            entries = change_feed.entries(state.cursor, CATCH_UP_LIMIT + 1)
+        except StaleCursor:
+            return False
+        # Versions moved with nothing logged: an unlogged bulk write.
+        if not entries or len(entries) > CATCH_UP_LIMIT:
+            return False
+        try:
+            state.apply(change_feed.changed_rows(entries))
+        except _Stale:
+            return False
+        # Versions were read before the log, so a commit that lands in
+        # between leaves them behind and the next lookup catches up again.
+        state.cursor = entries[-1][0]
+        state.synced = synced
+        return True
+
+    def _rebuild(self):
+        # Versions and cursor are read before the data, for the same reason.
+        state = IndexState(self._lock, table_versions.snapshot(INDEX_TABLES), change_feed.head())
+        state.load(db.session)
+        self._state = state
+        return state
+
+    def _rebuild_in_background(self):
+        self._rebuilding = True
+        threading.Thread(target=self._rebuild_worker, name='rate-index-rebuild', daemon=True).start()
+
+    def _rebuild_worker(self):
+        try:
+            with app.app_context():
+                try:
+                    state = IndexState(self._lock, table_versions.snapshot(INDEX_TABLES),
+                                       change_feed.head())
+                    state.load(db.session)
+                finally:
+                    db.session.remove()
+            with self._lock:
+                self._state = state
+        finally:
+            self._rebuilding = False
+
+    # -- lookups -----------------------------------------------------------
+
+    def period(self, as_of=None):
+        return self.view().period(as_of)
+
+
+_OPEN = (OPEN_START, OPEN_END, None, None)
+
+
+def _seconds(as_of):
+    return time.time() if as_of is None else to_seconds(as_of, None)
+
+
+_APPLY_ORDER = {'ports': 0, 'container_types': 0, 'port_pairs': 1, 'rates': 2}
+
+
+class _Stale(Exception):
+    pass
+
+
+rate_index = RateIndex()
@@ -0,0 +1,119 @@
+"""k-shortest loopless paths (Dijkstra + Yen) over a lane adjacency map.
+
+``adjacency`` maps a node to ``{neighbour: edge}`` and ``weight(edge)``
+returns a non-negative cost, or ``inf`` for an unusable edge. With
+``max_hops`` set, each search is a hop-bounded layered relaxation, which
+only touches the few-leg neighbourhood of the source instead of the whole
+graph.
+"""
+from heapq import heappush, heappop
+from itertools import count
+
+INF = float('inf')
+
+
+def shortest_path(adjacency, weight, source, target, banned_nodes=(), banned_edges=(),
+                  max_hops=None):
+    if max_hops is not None:
+        return _bounded_path(adjacency, weight, source, target, banned_nodes, banned_edges, max_hops)
+    dist = {source: 0.0}
+    prev = {}
+    heap = [(0.0, source)]
+    while heap:
+        d, u = heappop(heap)
+        if u == target:
+            break
+        if d > dist[u]:
+            continue
+        for v, edge in adjacency.get(u, {}).items():
+            if v in banned_nodes or (u, v) in banned_edges:
+                continue
+            w = weight(edge)
+            if w == INF:
+                continue
+            nd = d + w
+            if nd < dist.get(v, INF):
+                dist[v] = nd
+                prev[v] = u
+                heappush(heap, (nd, v))
+    if target not in dist:
+        return None
+    path = [target]
+    while path[-1] != source:
+        path.append(prev[path[-1]])
+    path.reverse()
+    return path
+
+
+def _bounded_path(adjacency, weight, source, target, banned_nodes, banned_edges, max_hops):
+    frontier = {source: 0.0}
+    parents = []
+    best = None  # (cost, hops)
+    for hop in range(max_hops):
+        nxt = {}
+        par = {}
+        for u, d in frontier.items():
+            for v, edge in adjacency.get(u, {}).items():
+                if v == source or v in banned_nodes or (u, v) in banned_edges:
+                    continue
+                nd = d + weight(edge)
+                if nd < nxt.get(v, INF) and (best is None or nd < best[0]):
+                    nxt[v] = nd
+                    par[v] = u
+        parents.append(par)
+        if target in nxt:
+            best = (nxt.pop(target), hop)
+            # Weights are non-negative, so nothing at or above the best
+            # cost so far can lead to a cheaper path.
+            nxt = {v: d for v, d in nxt.items() if d < best[0]}
+        frontier = nxt
+        if not frontier:
+            break
+    if best is None:
+        return None
+    path = [target]
+    for hop in range(best[1], -1, -1):
+        path.append(parents[hop][path[-1]])
+    path.reverse()
+    return path
+
+
+def path_cost(adjacency, weight, path):
+    return sum(weight(adjacency[u][v]) for u, v in zip(path, path[1:]))
+
+
+def k_shortest_paths(adjacency, weight, source, target, k, max_hops=None):
+    """Up to ``k`` loopless paths from source to target, cheapest first."""
+    if source == target:
+        return []
+    first = shortest_path(adjacency, weight, source, target, max_hops=max_hops)
+    if first is None:
+        return []
+    found = [first]
+    seen = {tuple(first)}
+    candidates = []
+    tie = count()
+    while len(found) < k:
+        last = found[-1]
+        for i in range(len(last) - 1):
+            if max_hops is not None and i >= max_hops:
+                break
+            spur = last[i]
+            root = last[:i + 1]
+            banned_edges = {(p[i], p[i + 1]) for p in found if p[:i + 1] == root}
+            spur_path = shortest_path(
+                adjacency, weight, spur, target,
+                banned_nodes=set(root[:-1]), banned_edges=banned_edges,
+                max_hops=None if max_hops is None else max_hops - i,
+            )
+            if spur_path is None:
+                continue
+            path = root[:-1] + spur_path
+            if tuple(path) in seen:
+                continue
+            seen.add(tuple(path))
+            heappush(candidates, (path_cost(adjacency, weight, path), next(tie), path))
+        if not candidates:
+            break
+        found.append(heappop(candidates)[2])
+    return found
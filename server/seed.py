@@ -2,60 +2,248 @@
 
 try:
     from server.config import app, db
-    from server.models import User, Port, PortPair, ContainerType, Rate
+    from server.models import User, Port, PortPair, ContainerType, Rate, Quote, QuoteRate
+    from server.passwords import password_hasher
+    from server.versions import table_versions, TABLES
 except ImportError:
     from config import app, db
-    from models import User, Port, PortPair, ContainerType, Rate
+    from models import User, Port, PortPair, ContainerType, Rate, Quote, QuoteRate
+    from passwords import password_hasher
+    from versions import table_versions, TABLES
 
 # Standard library imports
-from random import randint, choice as rc
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+from string import ascii_uppercase
 
 # Remote library imports
 from faker import Faker
+from sqlalchemy import text
 
 # Local imports
 
-if __name__ == '__main__':
-    fake = Faker()
-    print("Starting seed...")
-    # Seed code goes here!
+# The first rows of every table are the hand-written demo data; scale
+# parameters only add synthetic rows after them.
+DEMO_USERS = ["alice@example.com", "bob@example.com"]
+DEMO_PORTS = [("Melbourne", "AUMEL"), ("Sydney", "AUSYD"), ("Tokyo", "JPTYO")]
+CONTAINER_TYPES = [
+    ("20GP", "20’ General"), ("40HC", "40’ High Cube"), ("40GP", "40’ General"),
+    ("45HC", "45’ High Cube"), ("20RF", "20’ Reefer"), ("40RF", "40’ Reefer"),
+    ("20OT", "20’ Open Top"), ("40OT", "40’ Open Top"), ("20FR", "20’ Flat Rack"),
+    ("40FR", "40’ Flat Rack"), ("20TK", "20’ Tank"),
+]
+PASSWORD = "password"
+# With --history, current rates start here and superseded ones run back
+# from it in monthly tariffs.
+TARIFF_START = datetime(2026, 1, 1)
+TARIFF_LENGTH = timedelta(days=30)
 
-    with app.app_context():
-        db.drop_all()
-        db.create_all()
-
-        alice = User(email="alice@example.com"); alice.set_password("password")
-        bob = User(email="bob@example.com"); bob.set_password("password")
-        db.session.add_all([alice, bob])
-
-        mel = Port(name="Melbourne", code="AUMEL")
-        syd = Port(name="Sydney", code="AUSYD")
-        tyo = Port(name="Tokyo", code="JPTYO")
-        db.session.add_all([mel, syd, tyo])
-        db.session.flush()
-
-        pp1 = PortPair(origin_port_id=mel.id, destination_port_id=tyo.id)
-        pp2 = PortPair(origin_port_id=syd.id, destination_port_id=tyo.id)
-        db.session.add_all([pp1, pp2])
-        db.session.flush()
-
-        ct20 = ContainerType(code="20GP", description="20’ General")
-        ct40 = ContainerType(code="40HC", description="40’ High Cube")
-        db.session.add_all([ct20, ct40])
-        db.session.flush()
-
-        rates = []
-        for pp in [pp1, pp2]:
-            for ct in [ct20, ct40]:
-                rates.append(
-                    Rate(
-                        port_pair_id=pp.id,
-                        container_type_id=ct.id,
-                        base_rate=randint(800, 1800),
-                        transit_days=randint(10, 25),
-                    )
-                )
-        db.session.add_all(rates)
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Seed the database with a deterministic dataset.")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--ports", type=int, default=3)
+    parser.add_argument("--lanes-per-port", type=int, default=1,
+                        help="outgoing port pairs generated per port")
+    parser.add_argument("--container-types", type=int, default=2)
+    parser.add_argument("--rates-per-lane", type=int, default=1,
+                        help="rates per port pair and container type")
+    parser.add_argument("--history", type=int, default=0,
+                        help="superseded tariffs kept per rate")
+    parser.add_argument("--users", type=int, default=2)
+    parser.add_argument("--quotes-per-user", type=int, default=0)
+    parser.add_argument("--lines-per-quote", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=50000)
+    return parser.parse_args()
+
+
+def port_code(i):
+    # "Q" + four letters: 456,976 unique 5-letter upper-case codes.
+    letters = []
+    for _ in range(4):
+        i, r = divmod(i, 26)
+        letters.append(ascii_uppercase[r])
+    return "Q" + "".join(reversed(letters))
+
+
+def insert_batches(model, rows, batch_size):
+    table = model.__table__
+    count = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return count
+        db.session.execute(table.insert(), batch)
         db.session.commit()
-        print("Seeded!")
+        count += len(batch)
+
+
+def generate_users(n, password_hash):
+    for i in range(n):
+        email = DEMO_USERS[i] if i < len(DEMO_USERS) else f"user{i}@example.com"
+        yield {"id": i + 1, "email": email, "password_hash": password_hash}
+
+
+def generate_ports(n, fake):
+    for i in range(n):
+        if i < len(DEMO_PORTS):
+            name, code = DEMO_PORTS[i]
+        else:
+            name, code = fake.city(), port_code(i)
+        yield {"id": i + 1, "name": name, "code": code}
+
+
+def generate_lanes(rng, n_ports, per_port):
+    per_port = min(per_port, n_ports - 1)
+    lane_id = 0
+    for origin in range(1, n_ports + 1):
+        # Demo lanes all run to Tokyo, as the original fixtures did.
+        if per_port and origin < len(DEMO_PORTS) <= n_ports:
+            first = [len(DEMO_PORTS)]
+        else:
+            first = []
+        dests = set(first)
+        while len(dests) < per_port:
+            d = rng.randint(1, n_ports)
+            if d != origin:
+                dests.add(d)
+        for dest in sorted(dests):
+            lane_id += 1
+            yield lane_id, origin, dest
+
+
+def generate_rates(rng, n_lanes, n_types, per_lane, effective_from=None, first_id=1):
+    rate_id = first_id - 1
+    for lane in range(1, n_lanes + 1):
+        for ct in range(1, n_types + 1):
+            for _ in range(per_lane):
+                rate_id += 1
+                yield {
+                    "id": rate_id,
+                    "port_pair_id": lane,
+                    "container_type_id": ct,
+                    "base_rate": rng.randint(800, 1800),
+                    "transit_days": rng.randint(10, 25),
+                    "effective_from": effective_from,
+                    "effective_to": None,
+                }
+
+
+def generate_rate_history(rng, n_lanes, n_types, per_lane, per_rate, first_id):
+    """``per_rate`` expired tariffs before TARIFF_START for every rate
+    slot, newest first, numbered from ``first_id``."""
+    for depth in range(1, per_rate + 1):
+        start = TARIFF_START - depth * TARIFF_LENGTH
+        for row in generate_rates(rng, n_lanes, n_types, per_lane, start, first_id):
+            row["effective_to"] = start + TARIFF_LENGTH
+            yield row
+        first_id = row["id"] + 1
+
+
+def generate_quotes(n_users, per_user):
+    quote_id = 0
+    for user_id in range(1, n_users + 1):
+        for i in range(per_user):
+            quote_id += 1
+            yield {"id": quote_id, "title": f"Quote {quote_id}", "status": "Confirmed",
+                   "user_id": user_id, "version": 1}
+
+
+def generate_quote_rates(rng, n_quotes, n_rates, lines):
+    lines = min(lines, n_rates)
+    line_id = 0
+    for quote_id in range(1, n_quotes + 1):
+        for rate_id in sorted(rng.sample(range(1, n_rates + 1), lines)):
+            line_id += 1
+            yield {"id": line_id, "quote_id": quote_id, "rate_id": rate_id}
+
+
+def snapshot_quote_lines():
+    """Copy each line's rate onto it, then total the lines per quote."""
+    rate = "FROM rates WHERE rates.id = quote_rates.rate_id"
+    lane = ("FROM rates JOIN port_pairs ON port_pairs.id = rates.port_pair_id "
+            "JOIN ports ON ports.id = port_pairs.{} WHERE rates.id = quote_rates.rate_id")
+    lines = "FROM quote_rates WHERE quote_rates.quote_id = quotes.id"
+    db.session.execute(text(
+        "UPDATE quote_rates SET "
+        f"base_rate = (SELECT rates.base_rate {rate}), "
+        f"transit_days = (SELECT rates.transit_days {rate}), "
+        f"origin_code = (SELECT ports.code {lane.format('origin_port_id')}), "
+        f"destination_code = (SELECT ports.code {lane.format('destination_port_id')}), "
+        "container_code = (SELECT container_types.code FROM rates JOIN container_types "
+        "ON container_types.id = rates.container_type_id WHERE rates.id = quote_rates.rate_id)"))
+    db.session.execute(text(
+        "UPDATE quotes SET "
+        f"line_count = (SELECT COUNT(*) {lines}), "
+        f"total_base_rate = (SELECT COALESCE(SUM(quote_rates.base_rate * quote_rates.quantity), 0) {lines}), "
+        f"max_transit_days = (SELECT MAX(quote_rates.transit_days) {lines})"))
+    db.session.commit()
+
+
+def reset_sequences():
+    # Ids were generated here, so move Postgres sequences past them.
+    if db.engine.dialect.name != "postgresql":
+        return
+    for table in db.metadata.sorted_tables:
+        if "id" in table.c:
+            db.session.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                f"COALESCE((SELECT MAX(id) FROM {table.name}), 0) + 1, false)"))
+    db.session.commit()
+
+
+def seed(args):
+    rng = random.Random(args.seed)
+    fake = Faker()
+    Faker.seed(args.seed)
+    n_types = min(args.container_types, len(CONTAINER_TYPES))
+    started = time.perf_counter()
+
+    db.drop_all()
+    db.create_all()
+
+    # bcrypt is deliberately slow: hash once and share it across all users.
+    password_hash = password_hasher.hash(PASSWORD)
+
+    counts = {}
+    counts["users"] = insert_batches(User, generate_users(args.users, password_hash), args.batch_size)
+    counts["ports"] = insert_batches(Port, generate_ports(args.ports, fake), args.batch_size)
+    counts["container_types"] = insert_batches(ContainerType, (
+        {"id": i + 1, "code": code, "description": desc}
+        for i, (code, desc) in enumerate(CONTAINER_TYPES[:n_types])
+    ), args.batch_size)
+    counts["port_pairs"] = insert_batches(PortPair, (
+        {"id": lane_id, "origin_port_id": o, "destination_port_id": d}
+        for lane_id, o, d in generate_lanes(rng, args.ports, args.lanes_per_port)
+    ), args.batch_size)
+    history = getattr(args, "history", 0)
+    counts["rates"] = insert_batches(Rate, generate_rates(
+        rng, counts["port_pairs"], n_types, args.rates_per_lane,
+        TARIFF_START if history else None), args.batch_size)
+    if history and counts["rates"]:
+        counts["superseded_rates"] = insert_batches(Rate, generate_rate_history(
+            rng, counts["port_pairs"], n_types, args.rates_per_lane, history, counts["rates"] + 1),
+            args.batch_size)
+    counts["quotes"] = insert_batches(
+        Quote, generate_quotes(counts["users"], args.quotes_per_user), args.batch_size)
+    if counts["rates"]:
+        counts["quote_rates"] = insert_batches(QuoteRate, generate_quote_rates(
+            rng, counts["quotes"], counts["rates"], args.lines_per_quote), args.batch_size)
+        snapshot_quote_lines()
+
+    reset_sequences()
+    # Rows went in through Core, so tell running workers their caches are stale.
+    table_versions.bump(*TABLES)
+    return counts, time.perf_counter() - started
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    print("Starting seed...")
+    with app.app_context():
+        counts, elapsed = seed(args)
+    print(", ".join(f"{n} {table}" for table, n in counts.items()))
+    print(f"Seeded in {elapsed:.1f}s!")
@@ -0,0 +1,179 @@
+"""Precompiled replacements for ``SerializerMixin.to_dict``.
+
+``to_dict`` re-parses ``serialize_rules`` and re-walks the mapper for every
+object it serializes. Here the same rules are evaluated once per
+(model, only, rules) with sqlalchemy_serializer's own ``Schema``, producing
+a flat list of fields per model; serializing an object is then a loop of
+attribute reads. The output has the same keys and values as ``to_dict``
+(keys are emitted in sorted order rather than set order).
+
+``load_options`` turns a plan into ``selectinload`` options so the
+relationships a plan reads are loaded up front instead of lazily per row.
+"""
+import threading
+from datetime import date, datetime, time
+
+from sqlalchemy import inspect as sql_inspect
+from sqlalchemy.orm import ColumnProperty, RelationshipProperty, selectinload
+from sqlalchemy_serializer import SerializerMixin
+from sqlalchemy_serializer.lib.schema import Schema
+from sqlalchemy_serializer.serializer import Serializer
+
+SIMPLE_TYPES = (int, str, float, bool, type(None))
+# Relationship chains deeper than this are compiled on first use instead of
+# up front, so self-referencing rules cannot recurse forever.
+MAX_EAGER_DEPTH = 8
+
+_lock = threading.RLock()
+_plans = {}
+
+
+class ModelPlan:
+    __slots__ = ('model', 'fields')
+
+    def __init__(self, model, schema, depth=0):
+        self.model = model
+        schema.update(only=model.serialize_only, extend=model.serialize_rules)
+        keys = schema.keys
+        if schema.is_greedy:
+            keys.update(a.key for a in sql_inspect(model).attrs)
+
+        attrs = sql_inspect(model).attrs
+        fields = []
+        for key in sorted(keys):
+            if not schema.is_included(key):
+                continue
+            prop = attrs.get(key)
+            if isinstance(prop, ColumnProperty):
+                fields.append((key, _converter(model, prop), None))
+            else:
+                target = prop.mapper.class_ if isinstance(prop, RelationshipProperty) else None
+                fields.append((key, None, ValuePlan(schema.fork(key), target, depth + 1)))
+        self.fields = fields
+
+    def emit(self, obj):
+        d = {}
+        for key, convert, nested in self.fields:
+            value = getattr(obj, key)
+            if nested is not None:
+                value = nested.emit(value)
+            elif convert is not None and value is not None:
+                value = convert(value)
+            d[key] = value
+        return d
+
+
+class ValuePlan:
+    """Serializes a relationship or other non-column attribute."""
+    __slots__ = ('schema', 'relationship', 'plans')
+
+    def __init__(self, schema, target=None, depth=0):
+        self.schema = schema
+        self.relationship = target is not None
+        self.plans = {}
+        if target is not None and depth < MAX_EAGER_DEPTH:
+            self.plans[target] = ModelPlan(target, schema, depth)
+
+    def plan(self, model):
+        plan = self.plans.get(model)
+        if plan is None:
+            with _lock:
+                plan = self.plans.get(model)
+                if plan is None:
+                    plan = self.plans[model] = ModelPlan(model, self.schema)
+        return plan
+
+    def emit(self, value):
+        if callable(value) and Serializer.is_valid_callable(value):
+            value = value()
+        if isinstance(value, SIMPLE_TYPES):
+            return value
+        if isinstance(value, SerializerMixin):
+            return self.plan(type(value)).emit(value)
+        if isinstance(value, (list, tuple, set)):
+            return [self.emit_item(v) for v in value]
+        return self._fallback(value)
+
+    def emit_item(self, value):
+        if isinstance(value, SerializerMixin):
+            return self.plan(type(value)).emit(value)
+        if isinstance(value, SIMPLE_TYPES):
+            return value
+        return self._fallback(value)
+
+    def _fallback(self, value):
+        s = Serializer(
+            date_format=SerializerMixin.date_format,
+            datetime_format=SerializerMixin.datetime_format,
+            time_format=SerializerMixin.time_format,
+            decimal_format=SerializerMixin.decimal_format,
+            tzinfo=None,
+            serialize_types=(),
+        )
+        s.schema = self.schema
+        return s(value)
+
+
+def _converter(model, prop):
+    try:
+        python_type = prop.columns[0].type.python_type
+    except NotImplementedError:
+        return None
+    if python_type is datetime:
+        return lambda v: v.strftime(model.datetime_format)
+    if python_type is date:
+        return lambda v: v.strftime(model.date_format)
+    if python_type is time:
+        return lambda v: v.strftime(model.time_format)
+    return None
+
+
+def compile_plan(model, rules=(), only=()):
+    key = (model, tuple(rules), tuple(only))
+    plan = _plans.get(key)
+    if plan is None:
+        with _lock:
+            plan = _plans.get(key)
+            if plan is None:
+                schema = Schema()
+                schema.update(only=only, extend=rules)
+                plan = _plans[key] = ModelPlan(model, schema)
+    return plan
+
+
+def to_dict(obj, rules=(), only=()):
+    """Drop-in for ``obj.to_dict(rules=rules, only=only)``."""
+    return compile_plan(type(obj), rules, only).emit(obj)
+
+
+def to_dicts(objs, rules=(), only=()):
+    objs = list(objs)
+    if not objs:
+        return []
+    plan = compile_plan(type(objs[0]), rules, only)
+    return [plan.emit(o) if type(o) is plan.model else to_dict(o, rules, only) for o in objs]
+
+
+def field_names(model, rules=()):
+    """The keys ``to_dict`` emits for ``model`` under ``rules``."""
+    return frozenset(key for key, _, _ in compile_plan(model, rules).fields)
+
+
+def load_options(model, rules=(), only=()):
+    """``selectinload`` options for every relationship the plan reads."""
+    options = []
+
+    def walk(plan, path):
+        for key, _, nested in plan.fields:
+            if nested is None or not nested.relationship:
+                continue
+            loader = (path.selectinload if path is not None else selectinload)(
+                getattr(plan.model, key))
+            child = nested.plans.get(sql_inspect(plan.model).attrs[key].mapper.class_)
+            if child is not None and any(n is not None and n.relationship for _, _, n in child.fields):
+                walk(child, loader)
+            else:
+                options.append(loader)
+
+    walk(compile_plan(model, rules, only), None)
+    return options
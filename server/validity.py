@@ -0,0 +1,79 @@
+"""Validity intervals of rates.
+
+A rate applies from ``effective_from`` (inclusive) until ``effective_to``
+(exclusive). Either end may be NULL, which leaves it open, so rates created
+without dates are valid at every instant. Instants are naive UTC datetimes
+in the database and API, and seconds since the epoch in the rate index.
+"""
+import math
+from datetime import datetime, timezone
+
+from sqlalchemy import and_, or_
+
+try:
+    from .models import Rate
+except ImportError:
+    from models import Rate
+
+OPEN_START = -math.inf
+OPEN_END = math.inf
+_EPOCH = datetime(1970, 1, 1)
+
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def parse_instant(value):
+    """An ISO 8601 date or date-time as a naive UTC datetime.
+
+    Dates mean midnight UTC; offsets are converted to UTC. Raises ValueError.
+    """
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        if not isinstance(value, str):
+            raise ValueError(value)
+        dt = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def parse_interval(effective_from, effective_to):
+    """``(effective_from, effective_to)`` datetimes from raw values.
+
+    Missing or empty values stay open (None). Raises ValueError if either
+    is malformed or the interval is empty.
+    """
+    start = parse_instant(effective_from) if effective_from not in (None, '') else None
+    end = parse_instant(effective_to) if effective_to not in (None, '') else None
+    if start is not None and end is not None and end <= start:
+        raise ValueError("effective_to must be after effective_from")
+    return start, end
+
+
+def format_instant(dt):
+    return None if dt is None else dt.strftime(Rate.datetime_format)
+
+
+def to_seconds(dt, default):
+    """Seconds since the epoch of a naive UTC datetime, ``default`` for None."""
+    return default if dt is None else (dt - _EPOCH).total_seconds()
+
+
+def valid_at(instant, model=Rate):
+    """SQL condition: ``model``'s row is in force at ``instant``."""
+    return and_(
+        or_(model.effective_from.is_(None), model.effective_from <= instant),
+        or_(model.effective_to.is_(None), model.effective_to > instant),
+    )
+
+
+def overlapping(model, start):
+    """SQL condition: ``model``'s row started before ``start`` and is still
+    in force then, i.e. what a rate starting at ``start`` supersedes."""
+    return and_(
+        or_(model.effective_from.is_(None), model.effective_from < start),
+        or_(model.effective_to.is_(None), model.effective_to > start),
+    )
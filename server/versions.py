@@ -0,0 +1,117 @@
+"""Per-table version counters shared by every worker process.
+
+Counters live in a small memory-mapped file, so reading the current version
+of a table costs a few bytes of shared memory rather than a database query.
+ORM commits bump the tables they touched; bulk Core writes must call
+``table_versions.bump()`` themselves.
+
+The file starts with a random epoch, so recreating it can never hand out an
+ETag that a client saw before.
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+
+from sqlalchemy import event
+
+try:
+    from .config import app, db
+except ImportError:
+    from config import app, db
+
+TABLES = ('ports', 'port_pairs', 'container_types', 'rates', 'quotes', 'quote_rates', 'users')
+_SLOT = struct.Struct('<q')
+
+
+class TableVersions:
+    def __init__(self, path, tables=TABLES):
+        self.path = path
+        self.slots = {name: i + 1 for i, name in enumerate(tables)}
+        self._lock = threading.Lock()
+        self._open()
+
+    def _open(self):
+        size = _SLOT.size * (len(self.slots) + 1)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, os.urandom(_SLOT.size), 0)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._map = mmap.mmap(self._fd, size)
+
+    def reopen(self):
+        """Open a descriptor of our own after fork.
+
+        flock() locks belong to the open file description, which a forked
+        child shares with its parent, so workers must not share one.
+        """
+        self._lock = threading.Lock()
+        self._map.close()
+        os.close(self._fd)
+        self._open()
+
+    @property
+    def epoch(self):
+        return '%x' % (_SLOT.unpack_from(self._map, 0)[0] & 0xffffffffffffffff)
+
+    def get(self, table):
+        return _SLOT.unpack_from(self._map, self.slots[table] * _SLOT.size)[0]
+
+    def snapshot(self, tables):
+        return tuple(self.get(t) for t in tables)
+
+    def bump(self, *tables):
+        """Increment each table's version; returns {table: (old, new)}."""
+        changed = {}
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                for table in tables:
+                    offset = self.slots[table] * _SLOT.size
+                    old = _SLOT.unpack_from(self._map, offset)[0]
+                    _SLOT.pack_into(self._map, offset, old + 1)
+                    changed[table] = (old, old + 1)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return changed
+
+    def install(self, session):
+        event.listen(session, 'after_flush', self._collect)
+        event.listen(session, 'after_commit', self._bump_committed)
+        event.listen(session, 'after_soft_rollback', self._discard)
+
+    def _collect(self, session, flush_context):
+        touched = session.info.setdefault('touched_tables', set())
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            table = getattr(obj, '__tablename__', None)
+            if table in self.slots:
+                touched.add(table)
+
+    def _discard(self, session, previous_transaction):
+        session.info.pop('touched_tables', None)
+
+    def _bump_committed(self, session):
+        # Read by the in-process indexes' own after_commit listeners.
+        touched = session.info.pop('touched_tables', None)
+        session.info['bumped_tables'] = self.bump(*sorted(touched)) if touched else {}
+
+
+def default_path(database_uri, kind='versions'):
+    """A temp file shared by every worker serving ``database_uri``."""
+    digest = hashlib.sha1(database_uri.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f'freight-quotes-{kind}-{digest}')
+
+
+table_versions = TableVersions(
+    app.config.get('TABLE_VERSIONS_PATH')
+    or default_path(app.config['SQLALCHEMY_DATABASE_URI'])
+)
+table_versions.install(db.session)
+os.register_at_fork(after_in_child=table_versions.reopen)
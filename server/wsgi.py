@@ -0,0 +1,74 @@
+"""Production WSGI entry point.
+
+    gunicorn -c server/gunicorn.conf.py server.wsgi:app
+
+The gunicorn config preloads this module in the master, so imports, the
+rate index and the reference-data response cache are built once and shared
+copy-on-write by every worker. Each worker then drops the database
+connections it inherited and, with ``WARMUP``, opens fresh ones before it
+accepts traffic.
+
+The schema is not touched here: run ``flask db upgrade`` (or
+``flask init-db`` without migrations) before starting the server.
+"""
+import time
+
+try:
+    from . import app as _resources  # noqa: F401  (registers the API resources)
+    from .config import app, db
+    from .encoding import brotli
+    from .rate_index import rate_index
+    from .port_search import port_search
+except ImportError:
+    import app as _resources  # noqa: F401
+    from config import app, db
+    from encoding import brotli
+    from rate_index import rate_index
+    from port_search import port_search
+
+# Reference-data GETs whose cached responses are built before forking. The
+# unfiltered /rates list is left out: clients ask for one lane at a time,
+# and those lookups are served from the rate index.
+WARMUP_PATHS = ('/ports', '/port_pairs', '/container_types', '/bootstrap')
+
+
+def create_app(warmup=None):
+    if warmup is None:
+        warmup = app.config['WARMUP']
+    if warmup:
+        warm_caches()
+    return app
+
+
+def warm_caches():
+    """Load the in-memory indexes and prime the cached reference-data responses."""
+    started = time.perf_counter()
+    with app.app_context():
+        rate_index.ensure_loaded()
+        port_search.ensure_loaded()
+        db.session.remove()
+    client = app.test_client()
+    encodings = ('identity', 'gzip', 'br') if brotli is not None else ('identity', 'gzip')
+    for path in WARMUP_PATHS:
+        for encoding in encodings:
+            resp = client.get(path, headers={'Accept-Encoding': encoding})
+            if resp.status_code != 200:
+                app.logger.warning("warmup: GET %s returned %s", path, resp.status_code)
+    elapsed = time.perf_counter() - started
+    app.logger.info("warmup finished in %.2fs", elapsed)
+    return elapsed
+
+
+def worker_init():
+    """Run in each worker right after fork."""
+    with app.app_context():
+        # Pooled connections opened in the master must not be shared.
+        db.engine.dispose(close=False)
+        if app.config['WARMUP']:
+            conns = [db.engine.connect() for _ in range(max(1, app.config['WARMUP_CONNECTIONS']))]
+            for conn in conns:
+                conn.exec_driver_sql('SELECT 1')
+                conn.close()
+
+
+app = create_app()
@@ -0,0 +1,85 @@
+import os
+import sys
+import tempfile
+
+# The app reads its configuration on import.
+_tmp = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['TABLE_VERSIONS_PATH'] = os.path.join(_tmp, 'versions')
+os.environ['RATE_LIMIT_PATH'] = os.path.join(_tmp, 'buckets')
+os.environ['BCRYPT_LOG_ROUNDS'] = '4'
+os.environ['RATE_LIMITS_ENABLED'] = '0'
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from collections import OrderedDict  # noqa: E402
+
+import pytest  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from server import http_cache  # noqa: E402
+from server.app import app as flask_app  # noqa: E402
+from server.config import db  # noqa: E402
+from server.models import User, Port, PortPair, ContainerType, Rate  # noqa: E402
+
+PASSWORD = 'password'
+
+
+@pytest.fixture(scope='session')
+def app():
+    with flask_app.app_context():
+        db.create_all()
+        users = [User(email='alice@example.com'), User(email='bob@example.com')]
+        for user in users:
+            user.set_password(PASSWORD)
+        ports = [Port(name=f'Port {i}', code=f'PORT{i}') for i in range(4)]
+        db.session.add_all(users + ports)
+        db.session.flush()
+        pairs = [PortPair(origin_port_id=o.id, destination_port_id=d.id)
+                 for o in ports for d in ports if o is not d]
+        types = [ContainerType(code='20GP'), ContainerType(code='40HC')]
+        db.session.add_all(pairs + types)
+        db.session.flush()
+        db.session.add_all([Rate(port_pair_id=pp.id, container_type_id=ct.id,
+                                 base_rate=100 * pp.id + ct.id, transit_days=pp.id)
+                            for pp in pairs for ct in types])
+        db.session.commit()
+        db.session.remove()
+    yield flask_app
+
+
+def login(client, email):
+    resp = client.post('/auth/login', json={'email': email, 'password': PASSWORD})
+    assert resp.status_code == 200
+    return client
+
+
+@pytest.fixture
+def alice(app):
+    return login(app.test_client(), 'alice@example.com')
+
+
+@pytest.fixture
+def bob(app):
+    return login(app.test_client(), 'bob@example.com')
+
+
+@pytest.fixture
+def queries(app):
+    """Statements sent to the database, counted the way the benchmarks do."""
+    with app.app_context():
+        engine = db.engine
+    statements = []
+
+    def record(conn, cursor, statement, *_):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', record)
+    yield statements
+    event.remove(engine, 'before_cursor_execute', record)
+
+
+@pytest.fixture
+def cold_cache(app, monkeypatch):
+    """An empty HTTP cache, so responses are built whatever ran before."""
+    monkeypatch.setattr(http_cache, '_entries', OrderedDict())
+    monkeypatch.setattr(http_cache, '_size', 0)
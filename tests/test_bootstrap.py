@@ -0,0 +1,25 @@
+"""Section and field selection on /bootstrap."""
+import pytest
+
+
+@pytest.mark.parametrize('query', [
+    'include=ports,rates',
+    'fields[rates]=id',
+    'fields[ports]=id,secret',
+    'fields[port_pairs]=id,origin_port_id',
+    'fields[user]=password_hash',
+])
+def test_unknown_sections_and_fields_are_rejected(alice, query):
+    resp = alice.get(f'/bootstrap?{query}')
+    assert resp.status_code == 400
+    assert 'unknown' in resp.get_json()['error']
+
+
+def test_fields_are_trimmed_in_any_order(alice):
+    a = alice.get('/bootstrap?include=ports&fields[ports]=code,id').get_json()
+    b = alice.get('/bootstrap?include=ports&fields[ports]=id, code,id').get_json()
+    assert a == b
+    assert set(a['ports'][0]) == {'id', 'code'}
+
+    full = alice.get('/bootstrap?include=ports').get_json()
+    assert alice.get('/bootstrap?include=ports&fields[ports]=code,id,name').get_json() == full
@@ -0,0 +1,28 @@
+"""Pruning of the change log behind /changes."""
+from datetime import timedelta
+
+from server.changes import change_feed
+from server.config import db
+from server.models import ChangeLog, Port
+from server.rate_index import rate_index
+from server.validity import utcnow
+
+
+def test_prune_keeps_head_and_expires_older_cursors(app):
+    client = app.test_client()
+    with app.app_context():
+        db.session.add_all([Port(name=f'Pruned {c}', code=f'PRUN{c}') for c in 'XYZ'])
+        db.session.commit()
+        head = change_feed.head()
+        db.session.query(ChangeLog).update({ChangeLog.changed_at: utcnow() - timedelta(days=30)})
+        db.session.commit()
+
+        logged = db.session.query(ChangeLog).count()
+        assert change_feed.prune(utcnow() - timedelta(days=7)) == logged - 1
+        assert [row.id for row in db.session.query(ChangeLog)] == [head]
+        # The index's own cursor is gone too; load it again in this thread.
+        rate_index.ensure_loaded()
+
+    assert client.get(f'/changes?since={head}').get_json()['changes'] == []
+    assert client.get(f'/changes?since={head - 1}').status_code == 200
+    assert client.get(f'/changes?since={head - 2}').status_code == 410
@@ -0,0 +1,49 @@
+"""Eviction order of the shared HTTP cache."""
+import pytest
+
+from server import http_cache
+
+
+@pytest.fixture
+def cache(app, cold_cache, monkeypatch):
+    monkeypatch.setattr(http_cache, 'MAX_ENTRIES', 2)
+    with app.app_context():
+        yield
+
+
+def blob(name, builds):
+    def build():
+        builds.append(name)
+        return {'name': name}
+    return http_cache.cached_blob(name, ('ports',), build)
+
+
+def test_blob_hit_survives_eviction(cache):
+    builds = []
+    blob('a', builds)
+    blob('b', builds)
+    blob('a', builds)
+    blob('c', builds)
+    # 'b' was used least recently, so it made room for 'c'.
+    blob('a', builds)
+    blob('b', builds)
+    assert builds == ['a', 'b', 'c', 'b']
+
+
+def test_json_hit_survives_eviction(app, cache):
+    builds = []
+
+    def get(path):
+        with app.test_request_context(path):
+            def build():
+                builds.append(path)
+                return {'path': path}, 200
+            return http_cache.cached_json(('ports',), build)
+
+    get('/a')
+    get('/b')
+    get('/a')
+    get('/c')
+    get('/a')
+    get('/b')
+    assert builds == ['/a', '/b', '/c', '/b']
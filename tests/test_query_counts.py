@@ -0,0 +1,88 @@
+"""Statements per request on the hot endpoints, which must not grow with
+the number of rows returned."""
+import pytest
+
+
+def create_quotes(client, count):
+    for i in range(count):
+        resp = client.post('/quotes', json={'title': f'Quote {i}', 'rate_ids': [i + 1, i + 2]})
+        assert resp.status_code == 201
+
+
+@pytest.mark.parametrize('path', [
+    '/port_pairs',
+    '/port_pairs?origin=PORT0',
+    '/port_pairs?destination=PORT1',
+    '/port_pairs?limit=3&after_id=2',
+])
+def test_port_pairs_is_one_query(app, cold_cache, queries, path):
+    resp = app.test_client().get(path)
+    assert resp.status_code == 200
+    assert resp.get_json()
+    assert len(queries) == 1
+
+
+def test_quote_listing_queries_do_not_grow_with_quotes(alice, queries):
+    create_quotes(alice, 2)
+    queries.clear()
+    assert len(alice.get('/quotes').get_json()) >= 2
+    few = len(queries)
+
+    create_quotes(alice, 5)
+    queries.clear()
+    quotes = alice.get('/quotes').get_json()
+    assert len(quotes) >= 7
+    assert all(q['quote_rates'] for q in quotes)
+    # The quotes, then every listed quote's lines in one IN query.
+    assert len(queries) == few == 2
+
+
+def test_quote_summary_is_one_query(alice, queries):
+    create_quotes(alice, 3)
+    queries.clear()
+    resp = alice.get('/quotes?view=summary&status=Confirmed&limit=10')
+    assert resp.status_code == 200
+    assert len(queries) == 1
+
+
+def quote_of(client):
+    resp = client.post('/quotes', json={'title': 'Detail', 'rate_ids': [1, 2]})
+    assert resp.status_code == 201
+    return resp.get_json()['id']
+
+
+def user_lookups(queries):
+    return [s for s in queries if 'FROM users' in s]
+
+
+def test_quote_detail_is_two_queries(alice, queries):
+    qid = quote_of(alice)
+    queries.clear()
+    resp = alice.get(f'/quotes/{qid}')
+    assert resp.status_code == 200
+    assert len(resp.get_json()['quote_rates']) == 2
+    # The owned quote, then its lines; the session's user row is never loaded.
+    assert len(queries) == 2
+    assert not user_lookups(queries)
+
+
+def test_quote_detail_of_another_user(alice, bob, queries):
+    qid = quote_of(alice)
+    queries.clear()
+    assert bob.get(f'/quotes/{qid}').status_code == 403
+    # The ownership check, then whether the quote exists at all.
+    assert len(queries) == 2
+    assert not user_lookups(queries)
+
+
+def test_quote_writes_do_not_load_the_user(alice, queries):
+    qid = quote_of(alice)
+    queries.clear()
+    assert alice.patch(f'/quotes/{qid}', json={'title': 'Renamed'}).status_code == 200
+    assert alice.delete(f'/quotes/{qid}').status_code == 204
+    assert not user_lookups(queries)
+
+
+def test_session_user_is_loaded_once(alice, queries):
+    assert alice.get('/auth/me').status_code == 200
+    assert len(user_lookups(queries)) == 1
@@ -0,0 +1,118 @@
+"""Index regressions: no hot endpoint query may fall back to a full scan.
+
+Each case drives one endpoint, captures every statement it runs and checks
+``EXPLAIN QUERY PLAN`` for ``SCAN`` steps. Endpoints that list a whole
+table on purpose name the tables they may scan.
+"""
+from functools import cached_property
+from itertools import count
+
+import pytest
+from sqlalchemy import event
+
+from server.config import db
+
+INDEXED = ('ports', 'port_pairs', 'container_types', 'rates')
+
+# (method, path, json body, tables that may be scanned). Paths and bodies may
+# use rows made for the case: ``{r.quote}`` or a callable taking ``r``.
+CASES = [
+    ('post', '/auth/login', {'email': 'alice@example.com', 'password': 'password'}, ()),
+    ('get', '/auth/me', None, ()),
+    ('get', '/port_pairs?origin=PORT0', None, ()),
+    ('get', '/port_pairs?destination=PORT1', None, ()),
+    ('get', '/port_pairs?limit=10&after_id=1', None, ()),
+    ('post', '/ports', {'name': 'New', 'code': 'NNNNN'}, ()),
+    ('post', '/container_types', {'code': '45HC'}, ()),
+    ('post', '/port_pairs', lambda r: {'origin_port_id': r.port, 'destination_port_id': 1}, ()),
+    ('post', '/rates', {'port_pair_id': 1, 'container_type_id': 1, 'transit_days': 9, 'base_rate': 900}, ()),
+    ('post', '/rates', {'port_pair_id': 1, 'container_type_id': 1, 'transit_days': 9, 'base_rate': 800,
+                        'effective_from': '2099-01-01', 'supersede': True}, ()),
+    # Line snapshots come from the rate index, which may load here.
+    ('post', '/quotes', {'title': 'Plan', 'rate_ids': [1, 2]}, INDEXED),
+    ('get', '/quotes', None, ()),
+    ('get', '/quotes?view=summary&status=Confirmed&limit=10', None, ()),
+    ('get', '/quotes?sort=title&limit=10&after_id=1', None, ()),
+    ('get', '/quotes/{r.quote}', None, ()),
+    ('patch', '/quotes/{r.quote}', {'rate_ids': [2, 3]}, ()),
+    ('delete', '/quotes/{r.quote}', None, ()),
+    ('get', '/changes', None, ()),
+    ('get', '/changes?since={r.cursor}&limit=100', None, ()),
+    ('get', '/rates/export?port_pair_id=1&as_of=2099-06-01', None, ()),
+    # Full listings and the in-memory rate index load read whole tables.
+    ('get', '/ports', None, ('ports',)),
+    ('get', '/container_types', None, ('container_types',)),
+    ('get', '/port_pairs', None, ('port_pairs',)),
+    ('get', '/rates?port_pair_id=1', None, INDEXED),
+]
+
+
+_ports = count()
+
+
+class Rows:
+    """Rows a case needs, made through the API before it is measured."""
+
+    def __init__(self, client):
+        self.client = client
+
+    @cached_property
+    def quote(self):
+        resp = self.client.post('/quotes', json={'title': 'Plan', 'rate_ids': [1, 2]})
+        assert resp.status_code == 201
+        return resp.get_json()['id']
+
+    @cached_property
+    def cursor(self):
+        """A /changes cursor with a change after it."""
+        cursor = self.client.get('/changes').get_json()['cursor']
+        assert self.port
+        return cursor
+
+    @cached_property
+    def port(self):
+        resp = self.client.post('/ports', json={'name': 'Plan', 'code': f'PLAN{chr(65 + next(_ports))}'})
+        assert resp.status_code == 201
+        return resp.get_json()['id']
+
+
+@pytest.fixture
+def statements(app):
+    """Statements sent to the database, with their parameters."""
+    with app.app_context():
+        engine = db.engine
+    captured = []
+
+    def record(conn, cursor, statement, params, context, many):
+        if not many:
+            captured.append((statement, params))
+
+    event.listen(engine, 'before_cursor_execute', record)
+    yield captured
+    event.remove(engine, 'before_cursor_execute', record)
+
+
+def scans(conn, statement, params):
+    rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, params).fetchall()
+    return [row[-1] for row in rows
+            if row[-1].startswith('SCAN ') and not row[-1].startswith('SCAN CONSTANT')]
+
+
+@pytest.mark.parametrize('method,path,body,allowed', CASES,
+                         ids=[f'{method.upper()} {path}' for method, path, _, _ in CASES])
+def test_hot_queries_use_indexes(app, alice, statements, method, path, body, allowed):
+    rows = Rows(alice)
+    path = path.format(r=rows)
+    body = body(rows) if callable(body) else body
+    statements.clear()
+    resp = getattr(alice, method)(path, json=body) if body is not None else getattr(alice, method)(path)
+    assert resp.status_code < 400
+
+    found = []
+    with app.app_context():
+        conn = db.session.connection()
+        for statement, params in statements:
+            if statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+                found += [(s, ' '.join(statement.split())[:200]) for s in scans(conn, statement, params)
+                          if s.split()[1] not in allowed]
+    assert found == []
@@ -0,0 +1,20 @@
+"""Rate import when the database rejects some rows of a chunk."""
+
+
+def test_rejected_rows_are_named_and_the_rest_imported(alice):
+    body = (
+        "origin,destination,container,base_rate,transit_days\n"
+        "PORT0,PORT1,20GP,111,5\n"
+        # Passes validation, but no database column holds it.
+        f"PORT0,PORT1,20GP,222,{10 ** 30}\n"
+        "PORT1,PORT0,40HC,333,7\n"
+    )
+    resp = alice.post('/rates/import?format=csv', data=body, content_type='text/csv')
+    assert resp.status_code == 200
+    report = resp.get_json()
+    assert report['inserted'] == 2
+    assert report['errors'] == [{'line': 3, 'error': 'could not be written'}]
+
+    rates = alice.get('/rates/export?format=ndjson&port_pair_id=1').get_data(as_text=True)
+    assert '"base_rate":111.0' in rates
+    assert '"base_rate":222.0' not in rates